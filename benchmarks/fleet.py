@@ -0,0 +1,89 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Compares collecting the metrics of several stand-in services with a serial
+# loop over python/metrics.py against one run of python/fleet.py, and measures
+# the rounds of the collector on new and on reused connections. The metrics
+# endpoints are opened for every round.
+
+import argparse
+import contextlib
+import json
+from os import path
+import socket
+import subprocess
+import sys
+import time
+
+import harness
+
+
+def measure(sourceDir: str, services: int, rounds: int, unresponsive: bool = False) -> dict:
+    if not path.exists(f"{sourceDir}/python/fleet.py"):
+        print("No python/fleet.py in this source tree")
+        return {}
+    with contextlib.ExitStack() as stack:
+        metricsPorts = [harness.freePort() for _ in range(services)]
+        sandboxes = [stack.enter_context(harness.ServiceSandbox(
+            sourceDir, instance={"metricsInterval": 1, "metricsHttpPort": metricsPort}))
+            for metricsPort in metricsPorts]
+        # A third of the services each are reached on their control socket, on
+        # their control port and on their metrics endpoint.
+        targets = [(sandbox.controlSocket, f"127.0.0.1:{sandbox.controlPort}",
+                    f"http://127.0.0.1:{metricsPort}")[index % 3]
+                   for index, (sandbox, metricsPort) in enumerate(zip(sandboxes, metricsPorts))]
+        if unresponsive:
+            # Accepts connections but never answers, like a hung service.
+            silent = stack.enter_context(socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+            silent.bind(('127.0.0.1', 0))
+            silent.listen()
+            targets.append(f"127.0.0.1:{silent.getsockname()[1]}")
+
+        start = time.perf_counter()
+        for sandbox in sandboxes:
+            subprocess.run([sys.executable, f"{sandbox.baseDir}/python/metrics.py"], stdout=subprocess.DEVNULL,
+                           check=True, timeout=60)
+        serial = (time.perf_counter() - start) * 1000
+
+        command = [sys.executable, f"{sandboxes[0].baseDir}/python/fleet.py", "--json", "--timeout", "2"]
+        start = time.perf_counter()
+        subprocess.run([*command, *targets], stdout=subprocess.DEVNULL, check=True, timeout=60)
+        collector = (time.perf_counter() - start) * 1000
+        output = subprocess.run([*command, "--interval", "0.2", "--count", str(rounds), *targets],
+                                stdout=subprocess.PIPE, check=True, timeout=60).stdout
+    results = [json.loads(line) for line in output.splitlines()]
+    online = results[-1]["totals"]["online"]
+    cold = results[0]["durationMs"]
+    warm = sum(result["durationMs"] for result in results[1:]) / max(1, len(results) - 1)
+    print(f"{services} services, {online} online: serial metrics.py {serial:8.1f} ms, fleet.py {collector:8.1f} ms,"
+          f" round on new connections {cold:6.1f} ms, on reused connections {warm:6.1f} ms")
+    return {"fleet.serialMs": serial, "fleet.collectorMs": collector, "fleet.coldRoundMs": cold,
+            "fleet.warmRoundMs": warm}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fleet metrics collection of the OpenEdge Messaging Service")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--services", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--unresponsive", action="store_true", help="Add a target that never answers")
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    measure(args.source, args.services, args.rounds, args.unresponsive)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from glob import glob
+import json
+import os
+from os import path
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = path.dirname(path.realpath(__file__))
+REPOSITORY_DIR = path.dirname(BENCHMARK_DIR)
+MENU_END = b"::L-ConnSummary C-ConnDetail Y-ListAllProps Z-ListPropName\n"
+# The binary framing of the control socket: status byte and payload length.
+BINARY_HEADER = struct.Struct(">BI")
+BINARY_MORE = 0
+BINARY_REQUEST = 5
+
+
+def freePort() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class ServiceSandbox:
+    # Runs python/jmsadapter.py from a source tree against the fake adapter in
+    # benchmarks/dlc. The service finds its configuration relative to its own
+    # location, so the sources are copied into a scratch installation.
+    def __init__(self, sourceDir: str = REPOSITORY_DIR, environment: dict = None, instance: dict = None):
+        self.sourceDir = sourceDir
+        self.baseDir = tempfile.mkdtemp(prefix="oemessagingbench")
+        self.controlPort = freePort()
+        # Versions without the control socket ignore the setting.
+        self.controlSocket = f"{self.baseDir}/control.sock"
+        self.process: subprocess.Popen = None
+        shutil.copytree(f"{sourceDir}/python", f"{self.baseDir}/python",
+                        ignore=shutil.ignore_patterns("__pycache__"))
+        os.makedirs(f"{self.baseDir}/config")
+        os.makedirs(f"{self.baseDir}/jars")
+        for script in ("adaptman", "probe"):
+            if path.exists(f"{sourceDir}/{script}"):
+                shutil.copy(f"{sourceDir}/{script}", self.baseDir)
+        config = {
+            "environment": {"DLC": f"{BENCHMARK_DIR}/dlc", "WRKDIR": self.baseDir, "JMSPROVIDER": "Fake"},
+            "jvmArgs": [],
+            "instance": {"brokerName": "bench", "controlPort": self.controlPort, "controlSocket": self.controlSocket,
+                         "logToFile": True, "logDirectory": f"{self.baseDir}/log"}
+        }
+        config["environment"].update(environment or {})
+        config["instance"].update(instance or {})
+        with open(f"{self.baseDir}/config/adapter.json", "w") as jsonFile:
+            json.dump(config, jsonFile, indent=2)
+
+    def start(self, timeout: float = 10) -> None:
+        self.process = subprocess.Popen([sys.executable, f"{self.baseDir}/python/jmsadapter.py"],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.controlPort), 1).close()
+                # The probing connection occupies the control port of older versions
+                # until the service notices the disconnect.
+                time.sleep(0.5)
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("The service did not open its control port")
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    def cli(self, *args: str) -> subprocess.CompletedProcess:
+        # Runs python/jmsman.py of the scratch installation with the given arguments.
+        return subprocess.run([sys.executable, f"{self.baseDir}/python/jmsman.py", *args],
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=60)
+
+    def connect(self) -> socket.socket:
+        return socket.create_connection(('127.0.0.1', self.controlPort), 5)
+
+    def connectUnix(self) -> socket.socket | None:
+        # Returns a control socket connection in the binary framing, or None
+        # when the service has no control socket.
+        if not path.exists(self.controlSocket):
+            return None
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(5)
+        client.connect(self.controlSocket)
+        client.sendall(b"json\n")
+        binaryRoundTrip(client, None)
+        return client
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            try:
+                with self.connect() as client:
+                    client.sendall(b"e\n")
+                self.process.wait(15)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.baseDir, ignore_errors=True)
+
+    def logFiles(self) -> list:
+        return glob(f"{self.baseDir}/log/*")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def roundTrip(client: socket.socket, command: bytes, timeout: float = 60) -> tuple:
+    # Sends a command and reads until the adapter menu that ends every response.
+    # Returns the time to the first byte, the time to the end of the response
+    # and the size of the response.
+    client.settimeout(timeout)
+    firstByte = None
+    received = bytearray()
+    start = time.perf_counter()
+    client.sendall(command)
+    while not received.endswith(MENU_END):
+        data = client.recv(65536)
+        if not data:
+            raise ConnectionError("The service closed the connection")
+        if firstByte is None:
+            firstByte = time.perf_counter() - start
+        received += data
+    return firstByte, time.perf_counter() - start, len(received)
+
+
+def binaryRoundTrip(client: socket.socket, command: str | None, timeout: float = 60) -> tuple:
+    # Like roundTrip, on a connection in the binary framing. Without a command
+    # only a pending response is read.
+    client.settimeout(timeout)
+    firstByte = None
+    received = bytearray()
+    size = 0
+    start = time.perf_counter()
+    if command is not None:
+        request = json.dumps({"command": command}).encode('ascii')
+        client.sendall(BINARY_HEADER.pack(BINARY_REQUEST, len(request)) + request)
+    while True:
+        while len(received) >= BINARY_HEADER.size:
+            status, length = BINARY_HEADER.unpack_from(received)
+            if len(received) < BINARY_HEADER.size + length:
+                break
+            del received[:BINARY_HEADER.size + length]
+            size += length
+            if status != BINARY_MORE:
+                return firstByte, time.perf_counter() - start, size
+        data = client.recv(65536)
+        if not data:
+            raise ConnectionError("The service closed the connection")
+        if firstByte is None:
+            firstByte = time.perf_counter() - start
+        received += data
+
+
+def processStats(pid: int) -> dict:
+    # The peak and current resident memory in bytes and the CPU seconds used
+    # by a process, read from /proc.
+    stats = {}
+    with open(f"/proc/{pid}/status") as statusFile:
+        for line in statusFile:
+            name, _, value = line.partition(':')
+            if name in ("VmHWM", "VmRSS"):
+                stats[name] = int(value.split()[0]) * 1024
+    try:
+        # The scheduler statistics count in nanoseconds, where /proc/<pid>/stat
+        # only counts clock ticks, which is too coarse for an idle service.
+        with open(f"/proc/{pid}/schedstat") as schedstatFile:
+            stats["cpuSeconds"] = int(schedstatFile.read().split()[0]) / 1e9
+    except FileNotFoundError:
+        with open(f"/proc/{pid}/stat") as statFile:
+            # The command name may contain spaces, the fields after it do not.
+            fields = statFile.read().rsplit(')', 1)[1].split()
+        stats["cpuSeconds"] = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return stats
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
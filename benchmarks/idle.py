@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Measures the CPU time the service uses while no client is connected, with
+# the periodic metrics poll as its only work, as seconds per idle hour.
+
+import argparse
+import time
+
+import harness
+
+
+def measure(sourceDir: str, duration: float, metricsInterval: float) -> dict:
+    with harness.ServiceSandbox(sourceDir, instance={"metricsInterval": metricsInterval}) as sandbox:
+        before = harness.processStats(sandbox.pid)["cpuSeconds"]
+        start = time.monotonic()
+        time.sleep(duration)
+        used = harness.processStats(sandbox.pid)["cpuSeconds"] - before
+        elapsed = time.monotonic() - start
+    perHour = used * 3600 / elapsed
+    print(f"Idle for {elapsed:.0f} s (metricsInterval {metricsInterval} s): {perHour:8.2f} CPU seconds per hour")
+    return {"idle.cpuSecondsPerHour": perHour}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Idle CPU usage of the OpenEdge Messaging Service")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--metrics-interval", type=float, default=10)
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    measure(args.source, args.duration, args.metrics_interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Measures the command-to-first-byte and command-to-last-byte time of the
+# service for a Summary and for a large property listing, and the time a
+# scripted jmsman.py call takes from start to exit.
+#
+# To compare against another revision, check it out in a separate work tree
+# and pass it with --source, e.g.:
+#     git worktree add /tmp/before <revision>
+#     benchmarks/latency.py --source /tmp/before
+
+import argparse
+import time
+
+import harness
+
+
+def measure(sourceDir: str, iterations: int, propertyBytes: int) -> dict:
+    results = {}
+    with harness.ServiceSandbox(sourceDir, environment={"FAKE_PROPERTY_BYTES": str(propertyBytes)}) as sandbox:
+        with sandbox.connect() as client:
+            samples = []
+            for _ in range(iterations):
+                samples.append(harness.roundTrip(client, b"s\n"))
+            results.update(report("Summary (S)", "summary", samples))
+            samples = [harness.roundTrip(client, b"y\n")]
+            results.update(report(f"Properties (Y, {propertyBytes // 1024} KB)", "properties", samples))
+        client = sandbox.connectUnix()
+        if client:
+            with client:
+                samples = []
+                for _ in range(iterations):
+                    samples.append(harness.binaryRoundTrip(client, "s"))
+                results.update(report("Summary (S, Unix socket)", "summaryUnix", samples))
+        samples = []
+        for _ in range(max(1, iterations // 5)):
+            start = time.perf_counter()
+            sandbox.cli("s")
+            elapsed = time.perf_counter() - start
+            samples.append((elapsed, elapsed, 0))
+        results.update(report("CLI (jmsman.py s)", "cli", samples))
+    return results
+
+
+def report(label: str, name: str, samples: list) -> dict:
+    firstBytes = [firstByte * 1000 for firstByte, _, _ in samples]
+    complete = [total * 1000 for _, total, _ in samples]
+    print(f"{label:<28}: first byte p50 {harness.percentile(firstBytes, 0.5):9.2f} ms"
+          f"  p95 {harness.percentile(firstBytes, 0.95):9.2f} ms"
+          f"  | complete p50 {harness.percentile(complete, 0.5):9.2f} ms"
+          f"  p95 {harness.percentile(complete, 0.95):9.2f} ms")
+    return {
+        f"latency.{name}.completeP50Ms": harness.percentile(complete, 0.5),
+        f"latency.{name}.completeP95Ms": harness.percentile(complete, 0.95),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Command latency of the OpenEdge Messaging Service")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--property-bytes", type=int, default=204800)
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    measure(args.source, args.iterations, args.property_bytes)
+
+
+if __name__ == '__main__':
+    main()
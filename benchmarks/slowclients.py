@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Measures the peak memory of the service while clients that follow the
+# adapter output stop reading, and one client keeps requesting a large
+# property listing. The output buffer of each client is limited by
+# maxOutputBuffer, so the peak should not grow with the size of the output.
+
+import argparse
+import socket
+
+import harness
+
+MEGABYTE = 1048576
+
+
+def measure(sourceDir: str, slowClients: int, iterations: int, propertyBytes: int, maxOutputBuffer: int) -> dict:
+    with harness.ServiceSandbox(sourceDir, environment={"FAKE_PROPERTY_BYTES": str(propertyBytes)},
+                                instance={"maxOutputBuffer": maxOutputBuffer}) as sandbox:
+        baseline = harness.processStats(sandbox.pid)["VmRSS"]
+        followers = []
+        try:
+            for _ in range(slowClients):
+                follower = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                # A small receive buffer makes the service buffer the output itself.
+                follower.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+                follower.connect(('127.0.0.1', sandbox.controlPort))
+                follower.sendall(b"follow\n")
+                followers.append(follower)
+            with sandbox.connect() as client:
+                for _ in range(iterations):
+                    harness.roundTrip(client, b"y\n", timeout=300)
+            stats = harness.processStats(sandbox.pid)
+        finally:
+            for follower in followers:
+                follower.close()
+    peak = stats["VmHWM"] / MEGABYTE
+    growth = (stats["VmHWM"] - baseline) / MEGABYTE
+    print(f"{slowClients} slow clients, {iterations} x {propertyBytes // MEGABYTE} MB: "
+          f"peak RSS {peak:8.1f} MB, {growth:8.1f} MB above idle")
+    return {"slowClients.peakRssMegabytes": peak, "slowClients.growthMegabytes": growth}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Memory of the OpenEdge Messaging Service with slow clients")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--slow-clients", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--property-bytes", type=int, default=8 * MEGABYTE)
+    parser.add_argument("--max-output-buffer", type=int, default=4 * MEGABYTE)
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    measure(args.source, args.slow_clients, args.iterations, args.property_bytes, args.max_output_buffer)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Measures the wall time of short CLI invocations against a running service,
+# with and without the configuration cache, next to the start of a bare
+# interpreter. The fake DLC gets a large ubroker.properties. Next to the
+# metrics, which are JSON, an adapter command is timed, whose output is not.
+# The wall time of a process on the test machine moves in steps of about 16 ms,
+# so the CLI is also timed from within the interpreter, from the start of the
+# script to its end.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import harness
+
+MEGABYTE = 1048576
+
+
+def writeProperties(fileName: str, size: int) -> None:
+    # Many brokers with many properties, the adapter of the benchmark last.
+    with open(fileName, "w") as propertiesFile:
+        written = 0
+        broker = 0
+        while written < size:
+            lines = [f"[UBroker.AS.broker{broker:04d}]\n"]
+            lines.extend(f"property{index:03d}=value of property {index} of broker {broker}\n" for index in range(100))
+            text = "".join(lines) + "\n"
+            propertiesFile.write(text)
+            written += len(text)
+            broker += 1
+        propertiesFile.write("[Adapter.bench]\nmaxAdptrThreads=8\nmaxClientInstance=16\n")
+
+
+def timeCommand(command: list, runs: int, cwd: str = None, cacheFile: str = None) -> float:
+    # The median wall time in milliseconds. With a cache file, it is removed
+    # before every run to measure a cold start. The compiled modules are kept,
+    # like they are in an installation, and written by an extra first run.
+    environment = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+    subprocess.run(command, cwd=cwd, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                   check=True, timeout=60)
+    times = []
+    for _ in range(runs):
+        if cacheFile and os.path.exists(cacheFile):
+            os.remove(cacheFile)
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True, timeout=60)
+        times.append((time.perf_counter() - start) * 1000)
+    return harness.percentile(times, 0.5)
+
+
+IN_PROCESS = """
+import os, runpy, sys, time
+start = time.perf_counter()
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+try:
+    runpy.run_path(sys.argv[0], run_name="__main__")
+finally:
+    sys.stderr.write(f"{(time.perf_counter() - start) * 1000}\\n")
+"""
+
+
+def timeInProcess(command: list, runs: int) -> float:
+    # The median time from the start of the script to its end in milliseconds,
+    # without the start of the interpreter.
+    environment = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+    times = []
+    for run in range(runs + 1):
+        result = subprocess.run([sys.executable, "-c", IN_PROCESS, *command], env=environment,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True, timeout=60)
+        if run:
+            times.append(float(result.stderr.splitlines()[-1]))
+    return harness.percentile(times, 0.5)
+
+
+def measure(sourceDir: str, runs: int, propertyBytes: int) -> dict:
+    dlc = tempfile.mkdtemp(prefix="oemessagingdlc")
+    try:
+        os.symlink(f"{harness.BENCHMARK_DIR}/dlc/bin", f"{dlc}/bin")
+        os.makedirs(f"{dlc}/properties")
+        writeProperties(f"{dlc}/properties/ubroker.properties", propertyBytes)
+        with harness.ServiceSandbox(sourceDir, environment={"DLC": dlc}) as sandbox:
+            # Files changed in the last seconds are not cached, as if they were
+            # still being edited.
+            past = time.time() - 60
+            for fileName in (f"{dlc}/properties/ubroker.properties", f"{sandbox.baseDir}/config/adapter.json"):
+                os.utime(fileName, (past, past))
+            pythonDir = f"{sandbox.baseDir}/python"
+            cacheFile = f"{sandbox.baseDir}/config/.adapter.cache"
+            cli = [sys.executable, f"{pythonDir}/jmsman.py", "metrics"]
+            config = [sys.executable, "-c", "import adapterconfig;"
+                      " adapterconfig.readBrokerProperties(adapterconfig.AdapterConfig().instance)"]
+            results = {
+                "startup.interpreterMs": timeCommand([sys.executable, "-c", "pass"], runs),
+                "startup.cliMs": timeCommand(cli, runs),
+                "startup.cliColdMs": timeCommand(cli, runs, cacheFile=cacheFile),
+                "startup.cliAdapterMs": timeCommand([sys.executable, f"{pythonDir}/jmsman.py", "s"], runs),
+                "startup.cliScriptMs": timeInProcess([f"{pythonDir}/jmsman.py", "metrics"], runs),
+                "startup.cliAdapterScriptMs": timeInProcess([f"{pythonDir}/jmsman.py", "s"], runs),
+                "startup.metricsScriptMs": timeInProcess([f"{pythonDir}/metrics.py"], runs),
+                "startup.metricsMs": timeCommand([sys.executable, f"{pythonDir}/metrics.py"], runs),
+                "startup.configMs": timeCommand(config, runs, pythonDir),
+                "startup.configColdMs": timeCommand(config, runs, pythonDir, cacheFile),
+            }
+    finally:
+        shutil.rmtree(dlc, ignore_errors=True)
+    print(f"ubroker.properties of {propertyBytes / MEGABYTE:.0f} MB, median of {runs} runs:")
+    for name, value in results.items():
+        print(f"  {name:<28} {value:8.1f} ms")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CLI startup time of the OpenEdge Messaging Service")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--property-bytes", type=int, default=4 * MEGABYTE,
+                        help="Size of the generated ubroker.properties (default: 4 MB)")
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    measure(args.source, args.runs, args.property_bytes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Runs all benchmarks and compares the results with the baselines stored in
+# benchmarks/baselines.json. A result that is worse than its baseline by more
+# than the tolerance is reported as a regression and makes the suite exit with
+# code 1. Baselines depend on the machine, record them with --save on the
+# machine that runs the comparison.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import fleet
+import harness
+import idle
+import latency
+import slowclients
+import startup
+import throughput
+
+BASELINE_FILE = os.path.join(harness.BENCHMARK_DIR, "baselines.json")
+HIGHER_IS_BETTER = {"throughput.properties.megabytesPerSecond"}
+# Latencies of a few milliseconds vary more than the tolerance between runs.
+MINIMUM_MS_CHANGE = 5.0
+
+
+def runAll(sourceDir: str, quick: bool) -> dict:
+    results = {}
+    results.update(latency.measure(sourceDir, 20 if quick else 50, 204800))
+    results.update(throughput.measure(sourceDir, 1 if quick else 3, 16 * throughput.MEGABYTE))
+    results.update(slowclients.measure(sourceDir, 8, 1 if quick else 3, 8 * slowclients.MEGABYTE,
+                                       4 * slowclients.MEGABYTE))
+    results.update(fleet.measure(sourceDir, 4, 3 if quick else 5))
+    results.update(startup.measure(sourceDir, 10 if quick else 20, 4 * startup.MEGABYTE))
+    results.update(idle.measure(sourceDir, 20 if quick else 60, 10))
+    return results
+
+
+def compare(results: dict, baselines: dict, tolerance: float) -> list:
+    regressions = []
+    print(f"\n{'Benchmark':<44} {'Baseline':>12} {'Result':>12} {'Change':>8}")
+    for name, value in sorted(results.items()):
+        baseline = baselines.get(name)
+        if not baseline:
+            print(f"{name:<44} {'':>12} {value:12.2f}")
+            continue
+        change = (value - baseline) / baseline
+        worse = -change if name in HIGHER_IS_BETTER else change
+        significant = not name.endswith("Ms") or abs(value - baseline) >= MINIMUM_MS_CHANGE
+        flag = "  REGRESSION" if worse > tolerance and significant else ""
+        print(f"{name:<44} {baseline:12.2f} {value:12.2f} {change:+8.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark suite of the OpenEdge Messaging Service")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--quick", action="store_true", help="Fewer iterations and a shorter idle period")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Fraction a result may be worse than its baseline (default: 0.25)")
+    parser.add_argument("--save", action="store_true", help="Store the results as the new baselines")
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    results = runAll(args.source, args.quick)
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as jsonFile:
+            baselines = json.load(jsonFile)
+    regressions = compare(results, baselines.get("results", {}), args.tolerance)
+    if args.save:
+        with open(BASELINE_FILE, "w") as jsonFile:
+            json.dump({"recorded": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "machine": platform.node(),
+                       "python": platform.python_version(), "cpus": os.cpu_count(),
+                       "results": {name: round(value, 3) for name, value in sorted(results.items())}},
+                      jsonFile, indent=2)
+            jsonFile.write("\n")
+        print(f"\nBaselines saved to {BASELINE_FILE}")
+    elif regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
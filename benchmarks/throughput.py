@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Measures how fast the service relays a large property listing (Y) to a
+# client that reads as fast as it can, in MB/s, and the CPU time the service
+# spends per MB.
+
+import argparse
+
+import harness
+
+MEGABYTE = 1048576
+
+
+def measure(sourceDir: str, iterations: int, propertyBytes: int) -> dict:
+    rates = []
+    cpuPerMegabyte = []
+    with harness.ServiceSandbox(sourceDir, environment={"FAKE_PROPERTY_BYTES": str(propertyBytes)}) as sandbox:
+        with sandbox.connect() as client:
+            for _ in range(iterations):
+                cpuBefore = harness.processStats(sandbox.pid)["cpuSeconds"]
+                _, total, size = harness.roundTrip(client, b"y\n", timeout=300)
+                cpuUsed = harness.processStats(sandbox.pid)["cpuSeconds"] - cpuBefore
+                if size < propertyBytes:
+                    print(f"Only {size} of {propertyBytes} bytes were received")
+                rates.append(size / MEGABYTE / total)
+                cpuPerMegabyte.append(cpuUsed * 1000 / (size / MEGABYTE))
+    rate = harness.percentile(rates, 0.5)
+    cpu = harness.percentile(cpuPerMegabyte, 0.5)
+    label = f"Properties (Y, {propertyBytes // MEGABYTE} MB)"
+    print(f"{label:<28}: {rate:9.2f} MB/s  {cpu:9.2f} ms CPU per MB")
+    return {"throughput.properties.megabytesPerSecond": rate, "throughput.properties.cpuMsPerMegabyte": cpu}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Output throughput of the OpenEdge Messaging Service")
+    parser.add_argument("--source", default=harness.REPOSITORY_DIR,
+                        help="Root of the source tree to measure (default: this repository)")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--property-bytes", type=int, default=16 * MEGABYTE)
+    args = parser.parse_args()
+    print(f"Measuring {args.source}")
+    measure(args.source, args.iterations, args.property_bytes)
+
+
+if __name__ == '__main__':
+    main()
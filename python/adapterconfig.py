@@ -13,27 +13,115 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import platform
-from glob import glob
-import json
 from os import path
 
+import configcache
+from configcache import ConfigCache
+
+BASE_DIR = path.dirname(path.dirname(path.realpath(__file__)))
+_cache: ConfigCache = None
+
+
+def configCache() -> ConfigCache:
+    global _cache
+    if _cache is None:
+        _cache = ConfigCache(f"{BASE_DIR}/config/.adapter.cache")
+    return _cache
+
 
 class AdapterConfig:
     def __init__(self):
-        pythonDir = path.dirname(path.realpath(__file__))
-        self.baseDir = path.dirname(pythonDir)
-        with open(f"{self.baseDir}/config/adapter.json", "r") as jsonFile:
-            config = json.load(jsonFile)
-        jarFiles = glob(f"{self.baseDir}/jars/*.jar")
-        self.instance = AdapterInstance(config["instance"])
-        self.environment = config["environment"]
-        self.environment["JMSCLIENTJAR"] = f'{":".join(jarFiles)} {" ".join(config["jvmArgs"])}'
+        self.baseDir = BASE_DIR
+        configFile = f"{self.baseDir}/config/adapter.json"
+        # Adding or removing a jar changes the modification time of the folder.
+        keys = configcache.sourceKeys([configFile, f"{self.baseDir}/jars"])
+        cached = configCache().get("adapter", keys)
+        if cached is None:
+            # Only needed when the configuration changed since the last run.
+            from glob import glob
+            import json
+            with open(configFile, "r") as jsonFile:
+                config = json.load(jsonFile)
+            jarFiles = glob(f"{self.baseDir}/jars/*.jar")
+            configCache().put("adapter", keys, (config, jarFiles))
+        else:
+            config, jarFiles = cached
+        # Either a single "instance" or a list of "instances", which can each
+        # override the environment and the jvmArgs.
+        self.instances = []
+        for instanceConfig in config.get("instances", [config.get("instance")]):
+            environment = dict(config["environment"])
+            environment.update(instanceConfig.get("environment", {}))
+            jvmArgs = instanceConfig.get("jvmArgs", config["jvmArgs"])
+            environment["JMSCLIENTJAR"] = f'{":".join(jarFiles)} {" ".join(jvmArgs)}'
+            self.instances.append(AdapterInstance(instanceConfig, environment, jvmArgs))
+        self.instance = self.instances[0]
+        self.environment = self.instance.environment
+
+    def getInstance(self, brokerName: str | None) -> "AdapterInstance":
+        if brokerName is None:
+            return self.instance
+        for instance in self.instances:
+            if instance.brokerName == brokerName:
+                return instance
+        raise KeyError(f"Broker {brokerName} is not configured,"
+                       f" choose one of: {', '.join(instance.brokerName for instance in self.instances)}")
 
 
 class AdapterInstance:
-    def __init__(self, config):
+    def __init__(self, config, environment: dict, jvmArgs: list):
+        self.environment = environment
+        self.jvmArgs = jvmArgs
         self.brokerName = config["brokerName"]
-        self.controlPort = config["controlPort"]
+        self.controlSocket = config.get("controlSocket", None)
+        # With a control socket, the TCP control port is optional.
+        self.controlPort = config.get("controlPort", 0) if self.controlSocket else config["controlPort"]
+        self.controlSocketMode = int(str(config.get("controlSocketMode", "660")), 8)
         self.logToFile = config["logToFile"]
         self.logDirectory = config["logDirectory"]
+        self.logMaxBytes = config.get("logMaxBytes", 10485760)
+        self.logBackupCount = config.get("logBackupCount", 5)
+        self.logCompress = config.get("logCompress", False)
+        self.maxOutputBuffer = config.get("maxOutputBuffer", 4194304)
+        self.commandTimeout = config.get("commandTimeout", 30)
+        self.metricsInterval = config.get("metricsInterval", 10)
+        self.metricsHttpPort = config.get("metricsHttpPort", 0)
+        self.metricsHttpAddress = config.get("metricsHttpAddress", "127.0.0.1")
+        self.historySize = config.get("historySize", 8640)
+        self.scrollbackBytes = config.get("scrollbackBytes", 1048576)
+        self.scrollbackLines = config.get("scrollbackLines", 10000)
+        self.connectionStallSeconds = config.get("connectionStallSeconds", 300)
+        self.processSampleInterval = config.get("processSampleInterval", 10)
+        self.heapWarningRatio = config.get("heapWarningRatio", 0.9)
+        self.healthPort = config.get("healthPort", 0)
+        self.autoscale = config.get("autoscale", None)
+        self.readyTimeout = config.get("readyTimeout", 120)
+        self.restartOnFailure = config.get("restartOnFailure", True)
+        self.restartDelay = config.get("restartDelay", 1)
+        self.restartDelayMax = config.get("restartDelayMax", 60)
+        self.crashLoopLimit = config.get("crashLoopLimit", 5)
+        self.crashLoopWindow = config.get("crashLoopWindow", 600)
+        self.stopTimeout = config.get("stopTimeout", 5)
+        self.terminateTimeout = config.get("terminateTimeout", 5)
+        self.stats = config.get("stats", False)
+        self.statsLogInterval = config.get("statsLogInterval", 0)
+
+
+def readBrokerProperties(instance: AdapterInstance) -> dict:
+    fileName = f"{instance.environment['DLC']}/properties/ubroker.properties"
+    keys = configcache.sourceKeys([fileName])
+    adapters = configCache().get(f"ubroker:{fileName}", keys)
+    if adapters is None:
+        # The file is large, it is parsed once for all the adapters in it.
+        from configparser import ConfigParser
+        props = ConfigParser(comment_prefixes=('#', '%'))
+        props.read(fileName)
+        adapters = {section: {name: props.get(section, name, fallback="0")
+                              for name in ("maxAdptrThreads", "maxClientInstance")}
+                    for section in props.sections() if section.startswith("Adapter.")}
+        configCache().put(f"ubroker:{fileName}", keys, adapters)
+    adapter = adapters.get(f"Adapter.{instance.brokerName}", {})
+    return {
+        "maxAdptrThreads": int(adapter.get("maxAdptrThreads", 0)),
+        "maxClientInstance": int(adapter.get("maxClientInstance", 0)),
+    }
@@ -0,0 +1,247 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Incremental parser for the output of the adapter. Output is fed in chunks
+# as it is read from the adapter and turned into records as soon as each
+# record is complete, so large dumps are never held in memory as a whole.
+
+import re
+from typing import Callable
+
+SUMMARY_FIELDS = {
+    'Active Servers': ('activeServers',),
+    'Busy Servers': ('busyServers',),
+    'Locked Servers': ('lockedServers',),
+    'Available Servers': ('availableServers',),
+    'Active Clients (now, peak)': ('currentActiveClients', 'maximumActiveClients'),
+    'Client Queue Depth (cur, max)': ('currentClientQueueDepth', 'maximumClientQueueDepth'),
+    'Total Requests': ('totalRequests',),
+    'Rq Wait (max, avg)': ('maximumRequestWait', 'averageRequestWait'),
+}
+MENU_PREFIX = '::'
+MAX_LINE = 65536
+PROMPT_PREFIX = 'Enter '
+MENU_END = '::L-ConnSummary'
+LABELLED_LINE = re.compile(r'^\s*([^:=]*[^\s:=])\s*:\s?(.*)$')
+PROPERTY_LINE = re.compile(r'^\s*([\w.\-\[\]]+)\s*=\s*(.*)$')
+SERVER_ROW = re.compile(r'^\s*(\d+)\s+(\S+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*(.*)$')
+COLUMN_SEPARATOR = re.compile(r'\S+(?: \S+)*')
+CONNECTION_ID = re.compile(r'conn\w*\s*id', re.IGNORECASE)
+CLIENT_ID = re.compile(r'client\s*id', re.IGNORECASE)
+
+
+def isPrompt(line: bytes) -> bool:
+    # The adapter asks for input with a line like "Enter the property name: "
+    # and waits for it without ending the line.
+    text = line.decode('ascii', errors='replace').strip()
+    return text.startswith(PROMPT_PREFIX) and text.endswith(':')
+
+
+class SummaryRecord:
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+
+class ServerRecord:
+    # One line of the Server Detail (D) output.
+    def __init__(self, pid: int, state: str, port: int, requests: int, received: int, sent: int,
+                 started: str, lastChange: str):
+        self.pid = pid
+        self.state = state
+        self.port = port
+        self.requests = requests
+        self.received = received
+        self.sent = sent
+        self.started = started
+        self.lastChange = lastChange
+
+
+class ConnectionRecord:
+    # One connection from the Connection Summary (L) table or one block of the
+    # Connection Detail (C) output. All values are kept by their label.
+    def __init__(self, attributes: dict, detail: bool):
+        self.attributes = attributes
+        self.detail = detail
+        self.connectionId = ''
+        self.clientId = ''
+        for label, value in attributes.items():
+            if not self.connectionId and CONNECTION_ID.search(label):
+                self.connectionId = value
+            elif not self.clientId and CLIENT_ID.search(label):
+                self.clientId = value
+        if not self.connectionId:
+            self.connectionId = self.clientId or next(iter(attributes.values()), '')
+
+
+class PropertyRecord:
+    def __init__(self, name: str, value: str):
+        self.name = name
+        self.value = value
+
+
+class SectionEnd:
+    # Marks the end of a run of ServerRecords or ConnectionRecords, so that a
+    # consumer can replace its previous list.
+    def __init__(self, kind: type):
+        self.kind = kind
+
+
+class MenuRecord:
+    # The adapter printed its menu, which ends every response.
+    pass
+
+
+def emptySummary() -> dict:
+    summary = {'brokerStatus': ''}
+    for names in SUMMARY_FIELDS.values():
+        for name in names:
+            summary[name] = 0
+    return summary
+
+
+def valueSplitter(value: str) -> list[int]:
+    # Values look like "12", "(0, 3)" or "(15 ms, 1 ms)".
+    numbers = []
+    for item in value.strip(' ()').split(','):
+        try:
+            numbers.append(int(item.strip().removesuffix('ms').strip()))
+        except ValueError:
+            numbers.append(0)
+    return numbers
+
+
+def summaryFromBlock(block: dict) -> dict:
+    summary = emptySummary()
+    summary['brokerStatus'] = block.get('Broker Status', '')
+    for label, names in SUMMARY_FIELDS.items():
+        if label in block:
+            for name, number in zip(names, valueSplitter(block[label])):
+                summary[name] = number
+    return summary
+
+
+class OutputParser:
+    def __init__(self, onRecord: Callable[[object], None]):
+        self.onRecord = onRecord
+        self.partial = bytearray()
+        self.block: dict = {}
+        self.section: type = None
+        self.columns: list = None
+
+    def feed(self, data: bytes) -> None:
+        self.partial += data
+        start = 0
+        while (end := self.partial.find(b'\n', start)) >= 0:
+            self._parseLine(self.partial[start:end].decode('ascii', errors='replace').rstrip('\r'))
+            start = end + 1
+        del self.partial[:start]
+        if len(self.partial) > MAX_LINE:
+            self.partial.clear()
+
+    def _parseLine(self, line: str) -> None:
+        if line.startswith(MENU_PREFIX):
+            self._endSection()
+            if line.startswith(MENU_END):
+                self.onRecord(MenuRecord())
+            return
+        if not line.strip():
+            # Blank lines separate the blocks of the Connection Detail.
+            self._endBlock()
+            if self.section is not ConnectionRecord or self.columns:
+                self._endSection()
+            return
+        if line.startswith(PROMPT_PREFIX) and ': ' in line:
+            # The answer to a prompt follows the prompt on the same line.
+            line = line.split(': ', 1)[1]
+        if self.section is ServerRecord:
+            if self._parseServer(line):
+                return
+            self._endSection()
+        elif self.section is ConnectionRecord and self.columns:
+            self._parseConnectionRow(line)
+            return
+        if (match := LABELLED_LINE.match(line)) and '  ' not in match.group(1):
+            label, value = match.group(1), match.group(2).strip()
+            if label in self.block:
+                # A repeated label starts the next block of the Connection Detail.
+                self._endBlock()
+            self.block[label] = value
+            return
+        self._endBlock()
+        if match := PROPERTY_LINE.match(line):
+            self.onRecord(PropertyRecord(match.group(1), match.group(2)))
+            return
+        words = line.split()
+        if len(words) >= 2 and words[0] == 'PID' and words[1] == 'State':
+            self._startSection(ServerRecord)
+        elif re.search(r'client|conn', line, re.IGNORECASE) and len(COLUMN_SEPARATOR.findall(line)) >= 2 \
+                and '  ' in line.strip():
+            self._startSection(ConnectionRecord)
+            self.columns = [(match.start(), match.group()) for match in COLUMN_SEPARATOR.finditer(line)]
+
+    def _parseServer(self, line: str) -> bool:
+        match = SERVER_ROW.match(line)
+        if not match:
+            return False
+        rest = match.group(7)
+        words = rest.split()
+        if len(words) == 8:
+            started, lastChange = ' '.join(words[:4]), ' '.join(words[4:])
+        else:
+            parts = re.split(r'\s{2,}', rest, maxsplit=1)
+            started, lastChange = parts[0], parts[1] if len(parts) > 1 else ''
+        self.onRecord(ServerRecord(int(match.group(1)), match.group(2), int(match.group(3)), int(match.group(4)),
+                                   int(match.group(5)), int(match.group(6)), started, lastChange))
+        return True
+
+    def _parseConnectionRow(self, line: str) -> None:
+        # The table is aligned on the column headings.
+        attributes = {}
+        for index, (start, label) in enumerate(self.columns):
+            end = self.columns[index + 1][0] if index + 1 < len(self.columns) else len(line)
+            attributes[label] = line[start:end].strip()
+        self.onRecord(ConnectionRecord(attributes, False))
+
+    def _startSection(self, kind: type) -> None:
+        self._endSection()
+        self.section = kind
+
+    def _endSection(self) -> None:
+        self._endBlock()
+        if self.section:
+            self.onRecord(SectionEnd(self.section))
+        self.section = None
+        self.columns = None
+
+    def _endBlock(self) -> None:
+        block = self.block
+        if not block:
+            return
+        self.block = {}
+        if 'Broker Status' in block or 'Active Servers' in block:
+            self.onRecord(SummaryRecord(summaryFromBlock(block)))
+        elif any(CONNECTION_ID.search(label) or CLIENT_ID.search(label) for label in block):
+            if self.section is not ConnectionRecord:
+                self._endSection()
+                self.section = ConnectionRecord
+            self.onRecord(ConnectionRecord(block, True))
+
+
+def parseSummary(text: str) -> dict:
+    records = []
+    parser = OutputParser(records.append)
+    parser.feed(text.encode('ascii', errors='replace') + b'\n\n')
+    summaries = [record.fields for record in records if isinstance(record, SummaryRecord)]
+    return summaries[-1] if summaries else emptySummary()
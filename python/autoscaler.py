@@ -0,0 +1,114 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from history import intervalWait
+
+
+class Autoscaler:
+    # Decides how many adapter servers to add or trim from consecutive Summary
+    # snapshots. The manager issues the X and T commands; this class only keeps
+    # the state needed for the hysteresis and the cooldowns.
+    def __init__(self, config: dict, maxAdptrThreads: int):
+        self.interval = config.get("interval", 30)
+        self.minServers = config.get("minServers", 1)
+        if "maxServers" not in config and not maxAdptrThreads:
+            raise ValueError("maxServers is required when ubroker.properties has no maxAdptrThreads")
+        self.maxServers = config.get("maxServers", maxAdptrThreads)
+        if maxAdptrThreads:
+            self.maxServers = min(self.maxServers, maxAdptrThreads)
+        self.upQueueDepth = config.get("upQueueDepth", 1)
+        self.upBusyRatio = config.get("upBusyRatio", 0.8)
+        self.upRequestWait = config.get("upRequestWait", 100)
+        self.downBusyRatio = config.get("downBusyRatio", 0.3)
+        self.upAfter = config.get("upAfter", 1)
+        self.downAfter = config.get("downAfter", 5)
+        self.upStep = config.get("upStep", 1)
+        self.downStep = config.get("downStep", 1)
+        self.upCooldown = config.get("upCooldown", 60)
+        self.downCooldown = config.get("downCooldown", 300)
+        self.paused = False
+        self.upCount = 0
+        self.downCount = 0
+        self.lastChange = float('-inf')
+        self.lastAction: dict = None
+        self.previous: dict = None
+
+    def _requestWait(self, snapshot: dict) -> float:
+        # The adapter reports a lifetime average, so the average wait of the
+        # requests since the previous snapshot follows from the difference. It
+        # is ignored when too few requests were handled for the rounding of the
+        # averages.
+        previous = self.previous
+        self.previous = snapshot
+        if previous is None:
+            return 0.0
+        wait = intervalWait(previous["averageRequestWait"], previous["totalRequests"],
+                            snapshot["averageRequestWait"], snapshot["totalRequests"],
+                            snapshot["maximumRequestWait"])
+        return wait or 0.0
+
+    def evaluate(self, snapshot: dict, now: float) -> tuple[int, str]:
+        # Returns the number of servers to add (positive) or trim (negative)
+        # and the reason, or 0 when nothing has to change.
+        active = snapshot["activeServers"]
+        busy = snapshot["busyServers"]
+        depth = snapshot["currentClientQueueDepth"]
+        wait = self._requestWait(snapshot)
+        if active < self.minServers and now - self.lastChange >= self.upCooldown:
+            return self.minServers - active, f"{active} active servers, the minimum is {self.minServers}"
+        if active > self.maxServers and now - self.lastChange >= self.downCooldown:
+            return self.maxServers - active, f"{active} active servers, the maximum is {self.maxServers}"
+        ratio = busy / active if active else 1.0
+        reasons = []
+        if depth >= self.upQueueDepth:
+            reasons.append(f"client queue depth {depth}")
+        if ratio >= self.upBusyRatio:
+            reasons.append(f"{busy} of {active} servers busy")
+        if self.upRequestWait and wait >= self.upRequestWait:
+            reasons.append(f"request wait {wait:.0f} ms")
+        if reasons:
+            self.upCount += 1
+            self.downCount = 0
+        elif depth == 0 and ratio <= self.downBusyRatio:
+            self.downCount += 1
+            self.upCount = 0
+        else:
+            self.upCount = 0
+            self.downCount = 0
+
+        if (reasons and self.upCount >= self.upAfter and active < self.maxServers
+                and now - self.lastChange >= self.upCooldown):
+            return min(self.upStep, self.maxServers - active), ", ".join(reasons)
+        if (self.downCount >= self.downAfter and active > self.minServers
+                and now - self.lastChange >= self.downCooldown):
+            return (-min(self.downStep, active - self.minServers),
+                    f"{busy} of {active} servers busy for {self.downCount} checks")
+        return 0, ""
+
+    def applied(self, change: int, reason: str, now: float, timestamp: float) -> None:
+        self.lastChange = now
+        self.upCount = 0
+        self.downCount = 0
+        self.lastAction = {"timestamp": timestamp, "change": change, "reason": reason}
+
+    def status(self) -> dict:
+        return {
+            "paused": self.paused,
+            "minServers": self.minServers,
+            "maxServers": self.maxServers,
+            "upCount": self.upCount,
+            "downCount": self.downCount,
+            "lastAction": self.lastAction,
+        }
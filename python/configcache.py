@@ -0,0 +1,81 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Keeps the parsed configuration in a marshal file, so the CLI tools do not
+# parse adapter.json, glob the jars and read ubroker.properties on every run.
+# Each entry records the modification time and size of the files it was made
+# from, and is parsed again as soon as one of them differs.
+
+import marshal
+import os
+import sys
+import time
+
+CACHE_VERSION = 1
+# Files changed this recently are not cached, as a file system with a coarse
+# timestamp resolution could hide a second change within the same tick.
+SETTLE_NS = 2_000_000_000
+
+
+def sourceKeys(fileNames: list[str]) -> tuple:
+    # Taken before the files are read, so a change while reading them is
+    # noticed the next time.
+    keys = []
+    for fileName in fileNames:
+        try:
+            status = os.stat(fileName)
+            keys.append((status.st_mtime_ns, status.st_size))
+        except OSError:
+            keys.append(None)
+    return tuple(keys)
+
+
+class ConfigCache:
+    def __init__(self, fileName: str):
+        self.fileName = fileName
+        self.entries = {}
+        try:
+            with open(fileName, "rb") as cacheFile:
+                data = marshal.load(cacheFile)
+            # The marshal format may change between Python versions.
+            if data.get("version") == (CACHE_VERSION, sys.hexversion):
+                self.entries = data["entries"]
+        except (OSError, EOFError, ValueError, TypeError, AttributeError, KeyError):
+            pass
+
+    def get(self, name: str, keys: tuple):
+        # Returns the cached value, or None when it is missing or out of date.
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != keys:
+            return None
+        return entry[1]
+
+    def put(self, name: str, keys: tuple, value) -> None:
+        if self.entries.get(name) == (keys, value):
+            return
+        if any(key and key[0] > time.time_ns() - SETTLE_NS for key in keys):
+            return
+        self.entries[name] = (keys, value)
+        temporary = f"{self.fileName}.{os.getpid()}"
+        try:
+            with open(temporary, "wb") as cacheFile:
+                marshal.dump({"version": (CACHE_VERSION, sys.hexversion), "entries": self.entries}, cacheFile)
+            os.replace(temporary, self.fileName)
+        except (OSError, ValueError):
+            # A read-only installation simply parses the files every time.
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
@@ -0,0 +1,144 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# An index of the client connections of the adapter, built from the parsed
+# Connection Summary (L) and Connection Detail (C) output. Every new listing
+# is merged into the index, so that lookups and filters are answered from
+# memory and the changes between consecutive listings can be reported.
+
+from fnmatch import fnmatchcase
+import re
+
+from adapteroutput import ConnectionRecord
+
+IDLE_LABEL = re.compile(r'idle', re.IGNORECASE)
+QUEUE_LABEL = re.compile(r'queue|destination', re.IGNORECASE)
+COUNTER_LABEL = re.compile(r'msg|message|received|sent', re.IGNORECASE)
+NUMBER = re.compile(r'^\s*(\d+)')
+
+
+def number(value: str) -> int | None:
+    # "12", "12 s" or "12 ms" as 12.
+    match = NUMBER.match(value)
+    return int(match.group(1)) if match else None
+
+
+class IndexedConnection:
+    def __init__(self, record: ConnectionRecord, now: float):
+        self.connectionId = record.connectionId
+        self.clientId = record.clientId
+        self.attributes: dict[str, str] = {}
+        self.counters: dict[str, int] = {}
+        self.idleSeconds: int = None
+        self.queue = ''
+        self.detail = False
+        self.firstSeen = now
+        self.lastActivity = now
+        self.updated = now
+
+    def merge(self, record: ConnectionRecord, now: float) -> None:
+        # The attributes of L and C differ; those of the latest listing win.
+        self.attributes.update(record.attributes)
+        self.detail = self.detail or record.detail
+        self.clientId = record.clientId or self.clientId
+        counters = {}
+        for label, value in record.attributes.items():
+            if IDLE_LABEL.search(label):
+                self.idleSeconds = number(value)
+            elif QUEUE_LABEL.search(label):
+                self.queue = value
+            elif COUNTER_LABEL.search(label) and (count := number(value)) is not None:
+                counters[label] = count
+        # Only counters with the same label can be compared, L and C name them differently.
+        if any(self.counters.get(label, count) != count for label, count in counters.items()):
+            self.lastActivity = now
+        self.counters.update(counters)
+        self.updated = now
+
+    def idleFor(self, now: float) -> float:
+        # The idle time of the adapter is the most precise, without it the time
+        # since the message counters last changed is used.
+        if self.idleSeconds is not None:
+            return self.idleSeconds
+        return now - self.lastActivity
+
+    def isStalled(self, now: float, stallSeconds: float) -> bool:
+        return self.idleFor(now) >= stallSeconds
+
+    def report(self, now: float, stallSeconds: float) -> dict:
+        return {
+            "connectionId": self.connectionId,
+            "clientId": self.clientId,
+            "queue": self.queue,
+            "idleSeconds": self.idleSeconds,
+            "stalled": self.isStalled(now, stallSeconds),
+            "firstSeen": self.firstSeen,
+            "lastActivity": self.lastActivity,
+            "detail": self.detail,
+            "attributes": self.attributes,
+        }
+
+
+class ConnectionIndex:
+    def __init__(self, stallSeconds: float):
+        self.stallSeconds = stallSeconds
+        self.connections: dict[str, IndexedConnection] = {}
+        self.byClient: dict[str, str] = {}
+        self.stalled: set[str] = set()
+        self.updated = 0.0
+        self.diff: dict = {"from": None, "to": None, "new": [], "closed": [], "stalled": []}
+
+    def update(self, records: list[ConnectionRecord], now: float) -> dict:
+        # Merges a complete listing and returns what changed since the previous one.
+        previous = self.connections
+        connections = {}
+        for record in records:
+            connection = previous.get(record.connectionId) or connections.get(record.connectionId)
+            if connection is None:
+                connection = IndexedConnection(record, now)
+            connection.merge(record, now)
+            connections[record.connectionId] = connection
+        stalled = {connectionId for connectionId, connection in connections.items()
+                   if connection.isStalled(now, self.stallSeconds)}
+        self.diff = {
+            "from": self.updated or None,
+            "to": now,
+            "new": [connectionId for connectionId in connections if connectionId not in previous],
+            "closed": [connectionId for connectionId in previous if connectionId not in connections],
+            "stalled": sorted(stalled - self.stalled),
+        }
+        self.connections = connections
+        self.byClient = {connection.clientId: connectionId for connectionId, connection in connections.items()
+                         if connection.clientId}
+        self.stalled = stalled
+        self.updated = now
+        return self.diff
+
+    def lookup(self, identifier: str) -> IndexedConnection | None:
+        # By connection ID, or else by client ID.
+        connectionId = identifier if identifier in self.connections else self.byClient.get(identifier)
+        return self.connections.get(connectionId)
+
+    def select(self, now: float, idleOver: float = None, queue: str = None, stalled: bool = False) -> list:
+        selected = []
+        for connection in self.connections.values():
+            if idleOver is not None and connection.idleFor(now) <= idleOver:
+                continue
+            if queue is not None and not fnmatchcase(connection.queue, queue):
+                continue
+            if stalled and not connection.isStalled(now, self.stallSeconds):
+                continue
+            selected.append(connection.report(now, self.stallSeconds))
+        return selected
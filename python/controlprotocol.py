@@ -0,0 +1,194 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Framing used on the control port once a client has sent the "framed" verb.
+# Every frame is an ASCII header line "<status> <length>\n" followed by
+# <length> bytes of payload. A response is any number of MORE frames followed
+# by one frame with the final status of the command.
+#
+# After the "json" verb, both directions use binary frames instead: a header
+# of one status byte and a 4 byte big-endian length, followed by the payload.
+# The client sends REQUEST frames with a JSON object {"command": "s"}, with
+# optional "args" that are appended to the command. The responses are the
+# same as in the text framing, with the output of the adapter as payload.
+
+import socket
+import struct
+
+MORE = "MORE"
+OK = "OK"
+PROMPT = "PROMPT"
+TIMEOUT = "TIMEOUT"
+ERROR = "ERROR"
+REQUEST = "REQUEST"
+FRAMED = b"framed\n"
+JSON = b"json\n"
+MAX_HEADER = 64
+BINARY_HEADER = struct.Struct(">BI")
+BINARY_STATUS = (MORE, OK, PROMPT, TIMEOUT, ERROR, REQUEST)
+BINARY_CODES = {status: code for code, status in enumerate(BINARY_STATUS)}
+MAX_REQUEST = 65536
+
+
+def encodeFrame(status: str, payload: bytes = b'') -> bytes:
+    return f"{status} {len(payload)}\n".encode('ascii') + payload
+
+
+def encodeBinaryFrame(status: str, payload: bytes = b'') -> bytes:
+    return BINARY_HEADER.pack(BINARY_CODES[status], len(payload)) + payload
+
+
+def encodeRequest(command: str, args: list[str] = None) -> bytes:
+    # A command without characters that need escaping, which is almost every
+    # command, is encoded without json: importing it, and re which it imports,
+    # takes a large part of the start of the CLI tools.
+    if not args and command.isascii() and command.isprintable() and '"' not in command and '\\' not in command:
+        return encodeBinaryFrame(REQUEST, f'{{"command":"{command}"}}'.encode('ascii'))
+    import json
+    request = {"command": command}
+    if args:
+        request["args"] = args
+    return encodeBinaryFrame(REQUEST, json.dumps(request, separators=(',', ':')).encode('ascii'))
+
+
+def decodeRequest(payload: bytes) -> str:
+    # Returns the command line of a REQUEST frame, without the line ending.
+    import json
+    try:
+        request = json.loads(payload)
+        command = request["command"]
+        args = request.get("args", [])
+        if not isinstance(command, str) or not isinstance(args, list):
+            raise ValueError
+        line = " ".join([command, *(str(arg) for arg in args)])
+        if '\n' in line or '\r' in line:
+            raise ValueError
+        return line
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ProtocolError(f"Invalid request {payload[:64]!r}")
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class FrameReader:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+
+    def nextFrame(self) -> tuple[str, bytes] | None:
+        # Returns the next complete frame as (status, payload) or None when more
+        # data is needed.
+        end = self.buffer.find(b'\n', 0, MAX_HEADER)
+        if end < 0:
+            if len(self.buffer) >= MAX_HEADER:
+                raise ProtocolError("Invalid frame header")
+            return None
+        try:
+            status, length = self.buffer[:end].decode('ascii').split(' ')
+            length = int(length)
+        except ValueError:
+            raise ProtocolError(f"Invalid frame header {bytes(self.buffer[:end])!r}")
+        if len(self.buffer) < end + 1 + length:
+            return None
+        payload = bytes(self.buffer[end + 1:end + 1 + length])
+        del self.buffer[:end + 1 + length]
+        return status, payload
+
+
+class BinaryFrameReader:
+    def __init__(self, maxLength: int = None):
+        self.buffer = bytearray()
+        self.maxLength = maxLength
+
+    def feed(self, data: bytes) -> None:
+        self.buffer += data
+
+    def nextFrame(self) -> tuple[str, bytes] | None:
+        if len(self.buffer) < BINARY_HEADER.size:
+            return None
+        code, length = BINARY_HEADER.unpack_from(self.buffer)
+        if code >= len(BINARY_STATUS) or (self.maxLength is not None and length > self.maxLength):
+            raise ProtocolError(f"Invalid frame header {bytes(self.buffer[:BINARY_HEADER.size])!r}")
+        end = BINARY_HEADER.size + length
+        if len(self.buffer) < end:
+            return None
+        payload = bytes(self.buffer[BINARY_HEADER.size:end])
+        del self.buffer[:end]
+        return BINARY_STATUS[code], payload
+
+
+def connect(instance, timeout: float | None) -> socket.socket:
+    # Connects to the control socket of an instance when it has one, and to
+    # its control port otherwise.
+    if instance.controlSocket:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(timeout)
+        try:
+            client.connect(instance.controlSocket)
+        except OSError:
+            client.close()
+            raise
+        return client
+    return socket.create_connection(('127.0.0.1', instance.controlPort), timeout)
+
+
+class ControlSession:
+    # A blocking framed session with the service, for tools that query it. On
+    # the control socket, the binary framing is used.
+    def __init__(self, instance, timeout: float = 5):
+        self.socket = connect(instance, timeout)
+        self.binary = bool(instance.controlSocket)
+        if self.binary:
+            self.reader = BinaryFrameReader()
+            self.socket.sendall(JSON)
+        else:
+            self.reader = FrameReader()
+            self.socket.sendall(FRAMED)
+        self.readResponse()
+
+    def request(self, command: str) -> tuple[str, bytes]:
+        if self.binary:
+            self.socket.sendall(encodeRequest(command))
+        else:
+            self.socket.sendall(command.encode('ascii') + b'\n')
+        return self.readResponse()
+
+    def readResponse(self) -> tuple[str, bytes]:
+        output = bytearray()
+        while True:
+            frame = self.reader.nextFrame()
+            if frame is None:
+                data = self.socket.recv(65536)
+                if not data:
+                    raise ConnectionError("The service closed the connection")
+                self.reader.feed(data)
+                continue
+            status, payload = frame
+            output += payload
+            if status != MORE:
+                return status, bytes(output)
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
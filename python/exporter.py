@@ -0,0 +1,126 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import threading
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+JSON_CONTENT_TYPE = "application/json"
+
+# (name, type, help, snapshot field or function of the snapshot, extra labels)
+METRICS = [
+    ("oemessaging_up", "gauge", "Whether the service has a current summary of the adapter",
+     lambda snapshot: 1 if snapshot.get("status") == "Online" else 0, ""),
+    ("oemessaging_broker_active", "gauge", "Whether the Broker Status of the adapter is ACTIVE",
+     lambda snapshot: 1 if snapshot.get("brokerStatus") == "ACTIVE" else 0, ""),
+    ("oemessaging_servers", "gauge", "Adapter servers by state", "activeServers", 'state="active"'),
+    ("oemessaging_servers", "gauge", "Adapter servers by state", "busyServers", 'state="busy"'),
+    ("oemessaging_servers", "gauge", "Adapter servers by state", "lockedServers", 'state="locked"'),
+    ("oemessaging_servers", "gauge", "Adapter servers by state", "availableServers", 'state="available"'),
+    ("oemessaging_active_clients", "gauge", "Currently active clients", "currentActiveClients", ""),
+    ("oemessaging_active_clients_peak", "gauge", "Peak number of active clients", "maximumActiveClients", ""),
+    ("oemessaging_client_queue_depth", "gauge", "Current client queue depth", "currentClientQueueDepth", ""),
+    ("oemessaging_client_queue_depth_max", "gauge", "Maximum client queue depth", "maximumClientQueueDepth", ""),
+    ("oemessaging_requests_total", "counter", "Total requests handled by the adapter", "totalRequests", ""),
+    ("oemessaging_request_wait_max_milliseconds", "gauge", "Maximum request wait", "maximumRequestWait", ""),
+    ("oemessaging_request_wait_avg_milliseconds", "gauge", "Average request wait", "averageRequestWait", ""),
+    ("oemessaging_max_adapter_threads", "gauge", "maxAdptrThreads in ubroker.properties", "maxAdptrThreads", ""),
+    ("oemessaging_max_client_instances", "gauge", "maxClientInstance in ubroker.properties",
+     "maxClientInstance", ""),
+    ("oemessaging_adapter_startup_seconds", "gauge", "Time from starting the adapter until its first menu",
+     "startupSeconds", ""),
+    ("oemessaging_adapter_restarts_total", "counter", "Restarts of the adapter by the service", "restarts", ""),
+    ("oemessaging_process_cpu_seconds_total", "counter", "CPU time of the adapter and its child processes",
+     "processCpuSeconds", ""),
+    ("oemessaging_process_resident_memory_bytes", "gauge", "Resident memory of the adapter and its child processes",
+     "processRssBytes", ""),
+    ("oemessaging_process_threads", "gauge", "Threads of the adapter and its child processes", "processThreads", ""),
+    ("oemessaging_process_open_fds", "gauge", "Open file descriptors of the adapter and its child processes",
+     "processOpenFds", ""),
+    ("oemessaging_jvm_resident_memory_bytes", "gauge", "Resident memory of the JVM", "jvmRssBytes", ""),
+    ("oemessaging_jvm_heap_max_bytes", "gauge", "The maximum heap of the JVM from -Xmx in jvmArgs",
+     "heapMaxBytes", ""),
+    ("oemessaging_snapshot_timestamp_seconds", "gauge", "Time of the last summary of the adapter",
+     "timestamp", ""),
+]
+
+
+def renderMetrics(snapshots: dict) -> bytes:
+    # Renders the snapshots of all brokers in the Prometheus text format. The
+    # samples of one metric have to be grouped, so brokers are the inner loop.
+    lines = []
+    described = set()
+    for name, metricType, description, field, labels in METRICS:
+        if name not in described:
+            described.add(name)
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metricType}")
+        for brokerName, snapshot in snapshots.items():
+            value = field(snapshot) if callable(field) else snapshot.get(field, 0)
+            allLabels = f'broker="{brokerName}"' + (f",{labels}" if labels else "")
+            lines.append(f"{name}{{{allLabels}}} {value}")
+    lines.append("")
+    return "\n".join(lines).encode('utf-8')
+
+
+class MetricsExporter:
+    # Serves the metrics over HTTP from a background thread. The payloads are
+    # rendered when a snapshot changes, so a scrape only copies bytes. Next to
+    # the Prometheus text, /snapshots has the snapshots as a JSON list, for
+    # python/fleet.py. Both are read-only.
+    def __init__(self, address: str, port: int, logger: logging.Logger):
+        self.logger = logger
+        self.snapshots = {}
+        self.payload = renderMetrics(self.snapshots)
+        self.snapshotsJson = b'[]'
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path in ('/metrics', '/'):
+                    payload, contentType = exporter.payload, CONTENT_TYPE
+                elif path == '/snapshots':
+                    payload, contentType = exporter.snapshotsJson, JSON_CONTENT_TYPE
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="MetricsExporter", daemon=True)
+
+    def start(self) -> None:
+        self.logger.info(f"Serving metrics on http://{self.server.server_address[0]}:{self.server.server_address[1]}/metrics")
+        self.thread.start()
+
+    def update(self, brokerName: str, snapshot: dict) -> None:
+        self.snapshots[brokerName] = snapshot
+        self.payload = renderMetrics(self.snapshots)
+        self.snapshotsJson = json.dumps(list(self.snapshots.values())).encode('ascii')
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,302 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Collects the metrics snapshots of many services at once and merges them into
+# one table with cluster totals. Targets are "http://host:port" for the metrics
+# endpoint, which is read-only and can be reached from other hosts, or, on the
+# same host, "host:port" for a control port or the path of a control socket.
+# The control connections are kept open between rounds.
+
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import time
+
+import controlprotocol
+from controlprotocol import BinaryFrameReader, ProtocolError
+
+SUMMED = ("activeServers", "busyServers", "lockedServers", "availableServers", "currentActiveClients",
+          "currentClientQueueDepth", "totalRequests")
+COLUMNS = (("Active", "activeServers"), ("Busy", "busyServers"), ("Avail", "availableServers"),
+           ("Clients", "currentActiveClients"), ("Queue", "currentClientQueueDepth"),
+           ("Wait ms", "maximumRequestWait"), ("Req/s", "requestsPerSecond"))
+
+
+class FleetTarget:
+    def __init__(self, address: str):
+        self.address = address
+        self.path = address if "/" in address else None
+        if not self.path:
+            host, _, port = address.rpartition(":")
+            self.host = host or "127.0.0.1"
+            self.port = int(port)
+        self.reader: asyncio.StreamReader = None
+        self.writer: asyncio.StreamWriter = None
+        self.frames = BinaryFrameReader()
+        self.connects = 0
+        # The previous snapshot of each broker, for the request rate between rounds.
+        self.previous: dict[str, dict] = {}
+
+    async def _connect(self) -> None:
+        if self.path:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connects += 1
+        self.frames = BinaryFrameReader()
+        self.writer.write(controlprotocol.JSON)
+        await self._response()
+
+    async def _response(self) -> tuple[str, bytes]:
+        output = bytearray()
+        while True:
+            frame = self.frames.nextFrame()
+            if frame is None:
+                data = await self.reader.read(65536)
+                if not data:
+                    raise ConnectionError("The service closed the connection")
+                self.frames.feed(data)
+                continue
+            status, payload = frame
+            output += payload
+            if status != controlprotocol.MORE:
+                return status, bytes(output)
+
+    async def _request(self, command: str) -> tuple[str, bytes]:
+        if self.writer is not None:
+            try:
+                self.writer.write(controlprotocol.encodeRequest(command))
+                return await self._response()
+            except (OSError, ConnectionError):
+                # The service may have restarted since the previous round.
+                self.close()
+        await self._connect()
+        self.writer.write(controlprotocol.encodeRequest(command))
+        return await self._response()
+
+    async def request(self, command: str, timeout: float) -> tuple[str, bytes]:
+        try:
+            return await asyncio.wait_for(self._request(command), timeout)
+        except BaseException:
+            # A response may be half read, the connection can not be reused.
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+
+class HttpFleetTarget:
+    # The /snapshots document of a metrics endpoint, with the snapshots of all
+    # the brokers that share it. The endpoint answers from the snapshots the
+    # service already has, so the maximum age does not apply.
+    def __init__(self, address: str):
+        self.address = address
+        host, _, port = address.removeprefix("http://").rstrip("/").rpartition(":")
+        self.host = host or "127.0.0.1"
+        self.port = int(port)
+        self.previous: dict[str, dict] = {}
+
+    async def _get(self) -> tuple[str, bytes]:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(f"GET /snapshots HTTP/1.0\r\nHost: {self.host}:{self.port}\r\n\r\n".encode('ascii'))
+            response = await reader.read()
+        finally:
+            writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        try:
+            code = int(head.split(None, 2)[1])
+        except (IndexError, ValueError):
+            raise ProtocolError(f"Invalid HTTP response {head[:64]!r}")
+        if code != 200:
+            return controlprotocol.ERROR, f"HTTP status {code}".encode('ascii')
+        return controlprotocol.OK, body
+
+    async def request(self, command: str, timeout: float) -> tuple[str, bytes]:
+        return await asyncio.wait_for(self._get(), timeout)
+
+    def close(self) -> None:
+        pass
+
+
+def clusterTotals(brokers: list[dict]) -> dict:
+    online = [broker for broker in brokers if broker.get("status") == "Online"]
+    totals = {"brokers": len(brokers), "online": len(online)}
+    for field in SUMMED:
+        totals[field] = sum(broker.get(field, 0) for broker in online)
+    rates = [broker["requestsPerSecond"] for broker in online if "requestsPerSecond" in broker]
+    if rates:
+        totals["requestsPerSecond"] = round(sum(rates), 1)
+    totals["busyRatio"] = round(totals["busyServers"] / totals["activeServers"], 3) if totals["activeServers"] else 0
+    totals["maximumRequestWait"] = max((broker.get("maximumRequestWait", 0) for broker in online), default=0)
+    worst = max(online, key=lambda broker: broker.get("currentClientQueueDepth", 0), default=None)
+    if worst:
+        totals["worstClientQueueDepth"] = worst.get("currentClientQueueDepth", 0)
+        totals["worstClientQueueTarget"] = worst["target"]
+        totals["worstClientQueueBroker"] = worst.get("brokerName", worst["target"])
+    return totals
+
+
+class FleetCollector:
+    def __init__(self, targets: list[str], timeout: float = 5, maxAge: float = None):
+        self.targets = [HttpFleetTarget(address) if address.startswith("http://") else FleetTarget(address)
+                        for address in targets]
+        self.timeout = timeout
+        self.command = "metrics" if maxAge is None else f"metrics {maxAge:g}"
+
+    async def _collectTarget(self, target: FleetTarget | HttpFleetTarget) -> list[dict]:
+        try:
+            status, payload = await target.request(self.command, self.timeout)
+        except asyncio.TimeoutError:
+            return [{"target": target.address, "status": "Unreachable", "error": f"No answer in {self.timeout:g} s"}]
+        except (OSError, ConnectionError, ProtocolError) as error:
+            return [{"target": target.address, "status": "Unreachable", "error": str(error) or type(error).__name__}]
+        if status != controlprotocol.OK:
+            return [{"target": target.address, "status": "Error",
+                     "error": payload.decode('ascii', errors='replace').strip()}]
+        try:
+            # A control port answers with one snapshot, or nothing before the
+            # first Summary of the adapter; a metrics endpoint with a list.
+            snapshots = json.loads(payload) if payload.strip() else []
+            if isinstance(snapshots, dict):
+                snapshots = [snapshots]
+            if not isinstance(snapshots, list) or not all(isinstance(snapshot, dict) for snapshot in snapshots):
+                raise ValueError
+        except ValueError:
+            return [{"target": target.address, "status": "Error", "error": "Invalid snapshot"}]
+        if not snapshots:
+            return [{"target": target.address, "status": "Offline"}]
+        return [self._addRate(target, snapshot) for snapshot in snapshots]
+
+    def _addRate(self, target: FleetTarget | HttpFleetTarget, snapshot: dict) -> dict:
+        snapshot["target"] = target.address
+        snapshot.setdefault("status", "Offline")
+        if snapshot["status"] != "Online" or not isinstance(snapshot.get("timestamp"), (int, float)) \
+                or not isinstance(snapshot.get("totalRequests"), int):
+            return snapshot
+        key = snapshot.get("brokerName", "")
+        previous = target.previous.get(key)
+        if previous and snapshot["timestamp"] > previous["timestamp"] \
+                and snapshot["totalRequests"] >= previous["totalRequests"]:
+            snapshot["requestsPerSecond"] = round((snapshot["totalRequests"] - previous["totalRequests"])
+                                                  / (snapshot["timestamp"] - previous["timestamp"]), 1)
+        elif previous and snapshot["timestamp"] == previous["timestamp"] and "requestsPerSecond" in previous:
+            snapshot["requestsPerSecond"] = previous["requestsPerSecond"]
+        target.previous[key] = snapshot
+        return snapshot
+
+    async def collect(self) -> dict:
+        # One round: every target is queried at the same time, so a round takes
+        # as long as the slowest target, bounded by the timeout.
+        started = time.perf_counter()
+        results = await asyncio.gather(*(self._collectTarget(target) for target in self.targets))
+        brokers = [broker for result in results for broker in result]
+        return {
+            "timestamp": time.time(),
+            "durationMs": round((time.perf_counter() - started) * 1000, 1),
+            "totals": clusterTotals(brokers),
+            "brokers": brokers,
+        }
+
+    def close(self) -> None:
+        for target in self.targets:
+            target.close()
+
+
+def renderTable(result: dict) -> str:
+    width = max([len("Broker")] + [len(broker.get("brokerName", broker["target"])) for broker in result["brokers"]])
+    targetWidth = max(len(broker["target"]) for broker in result["brokers"]) if result["brokers"] else 0
+    header = f"{'Broker':<{width}}  {'Target':<{targetWidth}}  {'Status':<11}" \
+             + "".join(f" {title:>8}" for title, _ in COLUMNS)
+    lines = [header, "-" * len(header)]
+    for broker in result["brokers"]:
+        line = f"{broker.get('brokerName', broker['target']):<{width}}  {broker['target']:<{targetWidth}}" \
+               f"  {broker['status']:<11}"
+        if broker["status"] == "Online":
+            line += "".join(f" {broker.get(field, ''):>8}" for _, field in COLUMNS)
+        else:
+            line += f" {broker.get('error', '')}"
+        lines.append(line)
+    totals = result["totals"]
+    lines.append("-" * len(header))
+    lines.append(f"{'Total':<{width}}  {'':<{targetWidth}}  {str(totals['online']) + '/' + str(totals['brokers']):<11}"
+                 + "".join(f" {totals.get(field, ''):>8}" for _, field in COLUMNS))
+    if totals.get("worstClientQueueTarget"):
+        lines.append(f"Worst client queue depth {totals['worstClientQueueDepth']} on"
+                     f" {totals['worstClientQueueBroker']} ({totals['worstClientQueueTarget']}),"
+                     f" {totals['busyRatio']:.0%} of the servers busy,"
+                     f" collected in {result['durationMs']} ms")
+    return "\n".join(lines)
+
+
+def readTargets(fileName: str) -> list[str]:
+    # One target per line, blank lines and lines starting with # are skipped.
+    with open(fileName) as targetFile:
+        return [line.strip() for line in targetFile if line.strip() and not line.lstrip().startswith("#")]
+
+
+def localTargets() -> list[str]:
+    from adapterconfig import AdapterConfig
+    return [instance.controlSocket or f"127.0.0.1:{instance.controlPort}" for instance in AdapterConfig().instances]
+
+
+async def run(collector: FleetCollector, interval: float, count: int, asJson: bool) -> None:
+    rounds = 0
+    try:
+        while True:
+            started = time.monotonic()
+            result = await collector.collect()
+            print(json.dumps(result) if asJson else renderTable(result) + "\n", flush=True)
+            rounds += 1
+            if interval <= 0 or rounds == count:
+                return
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - started)))
+    finally:
+        collector.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Collects the metrics of many OpenEdge Messaging Services")
+    parser.add_argument("targets", nargs="*",
+                        help="http://host:port of a metrics endpoint, or on this host, host:port of a"
+                             " control port or path of a control socket (default: the brokers in"
+                             " config/adapter.json)")
+    parser.add_argument("-f", "--file", help="Read the targets from a file, one per line")
+    parser.add_argument("--json", action="store_true", help="Print every round as one line of JSON")
+    parser.add_argument("--interval", type=float, default=0, help="Repeat every interval seconds")
+    parser.add_argument("--count", type=int, default=0, help="Stop after this many rounds")
+    parser.add_argument("--timeout", type=float, default=5, help="Seconds to wait for each target (default: 5)")
+    parser.add_argument("--max-age", type=float,
+                        help="Maximum age of the snapshots in seconds, not for metrics endpoints")
+    args = parser.parse_args()
+    targets = args.targets + (readTargets(args.file) if args.file else [])
+    if not targets:
+        targets = localTargets()
+    collector = FleetCollector(targets, args.timeout, args.max_age)
+    try:
+        asyncio.run(run(collector, args.interval, args.count, args.json))
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == '__main__':
+    main()
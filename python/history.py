@@ -0,0 +1,169 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+import time
+
+# Column name and array type code. Every column is preallocated, so the memory
+# used by the history does not change once the service is running.
+COLUMNS = (
+    ("timestamp", 'd'),
+    ("totalRequests", 'q'),
+    ("currentClientQueueDepth", 'l'),
+    ("busyServers", 'l'),
+    ("availableServers", 'l'),
+    ("averageRequestWait", 'l'),
+    ("maximumRequestWait", 'l'),
+)
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# The largest error, in milliseconds, accepted in the average wait of the
+# requests between two snapshots.
+MAX_WAIT_ERROR = 5
+
+
+def parseDuration(text: str) -> float:
+    # "90" or "90s", "15m", "1h", "2d"
+    text = text.strip().lower()
+    if text and text[-1] in DURATION_UNITS:
+        return float(text[:-1]) * DURATION_UNITS[text[-1]]
+    return float(text)
+
+
+def percentile(weightedValues: list, fraction: float) -> float:
+    # weightedValues is a list of (value, weight), the result is the smallest
+    # value that covers the fraction of the total weight.
+    ordered = sorted(weightedValues)
+    total = sum(weight for _, weight in ordered)
+    if total <= 0:
+        return 0.0
+    covered = 0.0
+    for value, weight in ordered:
+        covered += weight
+        if covered >= fraction * total:
+            return value
+    return ordered[-1][0]
+
+
+def intervalWait(previousAverage: int, previousTotal: int, average: int, total: int, maximum: int) -> float | None:
+    # The average wait of the requests handled between two snapshots, from the
+    # lifetime averages the adapter reports. Those are rounded to milliseconds,
+    # which puts the result off by up to half the sum of the totals divided by
+    # the requests handled: a tick of the average of a busy adapter would look
+    # like seconds of wait. None when the error could exceed MAX_WAIT_ERROR.
+    handled = total - previousTotal
+    if handled <= 0 or (total + previousTotal) / 2 / handled > MAX_WAIT_ERROR:
+        return None
+    waited = average * total - previousAverage * previousTotal
+    # No request waited longer than the lifetime maximum.
+    return min(max(0.0, waited / handled), maximum)
+
+
+class MetricsHistory:
+    # A ring buffer of Summary samples.
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.columns = {name: array(typeCode, [0]) * capacity for name, typeCode in COLUMNS}
+        self.count = 0
+        self.next = 0
+
+    def add(self, snapshot: dict) -> None:
+        for name, column in self.columns.items():
+            column[self.next] = snapshot.get(name, 0)
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _indexes(self, seconds: float) -> list:
+        # Indexes of the samples in the window, oldest first.
+        timestamps = self.columns["timestamp"]
+        since = time.time() - seconds
+        indexes = []
+        for offset in range(1, self.count + 1):
+            index = (self.next - offset) % self.capacity
+            if timestamps[index] < since:
+                break
+            indexes.append(index)
+        indexes.reverse()
+        return indexes
+
+    def summarize(self, seconds: float) -> dict:
+        indexes = self._indexes(seconds)
+        result = {"window": seconds, "samples": len(indexes)}
+        if not indexes:
+            return result
+        timestamps = self.columns["timestamp"]
+        totals = self.columns["totalRequests"]
+        depths = self.columns["currentClientQueueDepth"]
+        busy = self.columns["busyServers"]
+        averages = self.columns["averageRequestWait"]
+        maximums = self.columns["maximumRequestWait"]
+
+        requests = 0
+        peakRate = 0.0
+        waits = []
+        for previous, current in zip(indexes, indexes[1:]):
+            handled = totals[current] - totals[previous]
+            if handled < 0:
+                # The adapter was restarted and its counters were reset.
+                continue
+            elapsed = timestamps[current] - timestamps[previous]
+            requests += handled
+            if elapsed > 0:
+                peakRate = max(peakRate, handled / elapsed)
+            wait = intervalWait(averages[previous], totals[previous], averages[current], totals[current],
+                                maximums[current])
+            if wait is not None:
+                waits.append((wait, handled))
+        span = timestamps[indexes[-1]] - timestamps[indexes[0]]
+        depthValues = [depths[index] for index in indexes]
+
+        result.update({
+            "from": timestamps[indexes[0]],
+            "to": timestamps[indexes[-1]],
+            "requests": requests,
+            "requestsPerSecond": round(requests / span, 3) if span > 0 else 0.0,
+            "requestsPerSecondPeak": round(peakRate, 3),
+            "queueDepthCurrent": depthValues[-1],
+            "queueDepthMin": min(depthValues),
+            "queueDepthMax": max(depthValues),
+            "queueDepthAverage": round(sum(depthValues) / len(depthValues), 3),
+            "queueDepthTrendPerMinute": round(self._slope(indexes, depths) * 60, 3),
+            "busyServersAverage": round(sum(busy[index] for index in indexes) / len(indexes), 3),
+            "busyServersMax": max(busy[index] for index in indexes),
+            "requestWaitAverage": averages[indexes[-1]],
+            "requestWaitMax": maximums[indexes[-1]],
+        })
+        if waits:
+            # Only from the intervals in which enough requests were handled.
+            result.update({
+                "requestWaitP50": round(percentile(waits, 0.5), 1),
+                "requestWaitP90": round(percentile(waits, 0.9), 1),
+                "requestWaitP99": round(percentile(waits, 0.99), 1),
+            })
+        return result
+
+    def _slope(self, indexes: list, column: array) -> float:
+        # Least squares slope of the column against time, per second.
+        timestamps = self.columns["timestamp"]
+        if len(indexes) < 2:
+            return 0.0
+        origin = timestamps[indexes[0]]
+        xs = [timestamps[index] - origin for index in indexes]
+        ys = [column[index] for index in indexes]
+        meanX = sum(xs) / len(xs)
+        meanY = sum(ys) / len(ys)
+        variance = sum((x - meanX) ** 2 for x in xs)
+        if variance == 0:
+            return 0.0
+        return sum((x - meanX) * (y - meanY) for x, y in zip(xs, ys)) / variance
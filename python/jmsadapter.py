@@ -15,235 +15,1545 @@
 # limitations under the License.
 
 import sys
-from logging.handlers import RotatingFileHandler
+from collections import deque
 
+import adapteroutput
 import adapterconfig
+from autoscaler import Autoscaler
+from connectionindex import ConnectionIndex
+import controlprotocol
 from enum import Enum
+from exporter import MetricsExporter
+from history import MetricsHistory
+import history
+from logwriter import AdapterOutput, LogWriter
+from processsampler import ProcessSampler
+import processsampler
+from relaybuffer import RelayBuffer
+from scrollback import Scrollback
+import scrollback
+from servicestats import InstanceStats, LoopStats
+from timerqueue import Timer, TimerQueue
+from typing import Callable
+import errno
+import json
 import logging
 import os
 import pathlib
+import platform
 import selectors
+import signal
 import socket
+import stat
 import subprocess
 import time
 
+READ_SIZE = 65536
+# Every response of the adapter ends with its two line menu.
+MENU_END = adapteroutput.MENU_END.encode('ascii')
+PROMPT_IDLE = 0.25
+DEFAULT_MAX_AGE = 5
+# The properties only change when the adapter restarts, and their listing is large.
+PROPERTIES_MAX_AGE = 300
+
 
 class StreamType(Enum):
     SERVER = 0
     CLIENT = 1
     ADAPTER = 2
+    HEALTH = 3
+    ADAPTER_INPUT = 4
+    PROCESS = 5
+    SIGNAL = 6
+
+
+class StopPhase(Enum):
+    # The steps of stopping the adapter, each with its own timeout.
+    EXIT = "exit"
+    TERMINATE = "terminate"
+    KILL = "kill"
+
+
+class HealthStatus(Enum):
+    # The single byte sent on the health port.
+    ACTIVE = b'A'
+    RUNNING = b'R'
+    DOWN = b'D'
+
+
+class ResponseStatus(Enum):
+    OK = controlprotocol.OK
+    PROMPT = controlprotocol.PROMPT
+    TIMEOUT = controlprotocol.TIMEOUT
+    ERROR = controlprotocol.ERROR
 
 
 class AdapterProcess:
-    def __init__(self, config: adapterconfig.AdapterConfig, logger: logging.Logger):
-        self.config = config
+    def __init__(self, instance: adapterconfig.AdapterInstance, logger: logging.Logger,
+                 onOutput: Callable[[bytes], None], onRecord: Callable[[object], None]):
+        self.instance = instance
         self.logger = logger
+        self.onOutput = onOutput
+        self.parser = adapteroutput.OutputParser(onRecord)
         self.process: subprocess.Popen = None
-        self.output = b''
+        self.selector: selectors.DefaultSelector = None
+        self.owner = None
+        self.outputClosed = False
+        # Input the adapter did not accept yet, written when its stdin is writable.
+        self.input = bytearray()
+        self.writing = False
+        # A file descriptor that becomes readable when the process exits.
+        self.pidfd: int = None
+        self.exitCode: int = None
 
     @property
     def isRunning(self) -> bool:
-        return self.process.poll() is None
+        return self.exitCode is None
 
-    def run(self, selector: selectors.DefaultSelector) -> None:
+    def run(self, selector: selectors.DefaultSelector, owner) -> None:
         env = os.environ.copy()
-        env.update(self.config.environment)
-        command = [f'{self.config.environment["DLC"]}/bin/oemessaging', 'start', self.config.instance.brokerName]
+        env.update(self.instance.environment)
+        command = [f'{self.instance.environment["DLC"]}/bin/oemessaging', 'start', self.instance.brokerName]
         self.logger.info(f"Starting adapter: {command}")
         self.process = subprocess.Popen(
             command,
-            bufsize=1, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT, shell=False, env=env,
-            text=True)
+            bufsize=0, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT, shell=False, env=env, start_new_session=True)
         os.set_blocking(self.process.stdout.fileno(), False)
-        selector.register(self.process.stdout, selectors.EVENT_READ, StreamType.ADAPTER)
-        time.sleep(1)
-        result = self.process.poll()
-        if result is None:
-            self.logger.info(f"Adapter started: PID {self.process.pid}")
-        else:
-            self.logger.critical("")
-            self.logger.critical("!" * 49)
-            self.logger.critical(f"!! Adapter process terminated with exit code {result} !!")
-            self.logger.critical("!" * 49)
-            self.logger.critical("")
-            line = self.process.stdout.readline()
-            while line:
-                self.logger.critical(line.splitlines()[0])
-                line = self.process.stdout.readline()
+        os.set_blocking(self.process.stdin.fileno(), False)
+        self.selector = selector
+        self.owner = owner
+        selector.register(self.process.stdout, selectors.EVENT_READ, (owner, StreamType.ADAPTER))
+        try:
+            self.pidfd = os.pidfd_open(self.process.pid)
+            selector.register(self.pidfd, selectors.EVENT_READ, (owner, StreamType.PROCESS))
+        except (AttributeError, OSError):
+            # Without pidfd (Linux before 5.3), the end of the output signals the exit.
+            self.pidfd = None
+        self.logger.info(f"Adapter started: PID {self.process.pid}")
+
+    def onExit(self) -> int:
+        # The pidfd became readable: the process has exited and can be reaped
+        # without waiting. Whatever it wrote before exiting is still read.
+        self.exitCode = self.process.wait()
+        self.selector.unregister(self.pidfd)
+        if not self.outputClosed:
+            self.readOutput(self.process.stdout)
+        if not self.outputClosed:
+            # A child of the adapter still holds the pipe open.
+            self.selector.unregister(self.process.stdout)
+            self.outputClosed = True
+        return self.exitCode
+
+    def reap(self) -> int:
+        # The adapter closed its output, so it is exiting. Make sure it is gone.
+        try:
+            self.exitCode = self.process.wait(1)
+        except subprocess.TimeoutExpired:
+            self.sendSignal(signal.SIGKILL)
+            self.exitCode = self.process.wait()
+        return self.exitCode
+
+    def sendSignal(self, number: int) -> None:
+        # The adapter leads its own process group, so the JVM and its other
+        # children get the signal as well, rather than being left running
+        # without it.
+        try:
+            os.killpg(self.process.pid, number)
+        except ProcessLookupError:
+            pass
+
+    def logExit(self, exitCode: int) -> None:
+        self.logger.critical("")
+        self.logger.critical("!" * 49)
+        self.logger.critical(f"!! Adapter process terminated with exit code {exitCode} !!")
+        self.logger.critical("!" * 49)
+        self.logger.critical("")
 
     def readOutput(self, fileDescriptor) -> None:
-        while self.process.poll() is None:
+        # Drain everything the adapter has written so far. The pipe is non-blocking,
+        # so this returns as soon as it is empty instead of waiting for more output.
+        while True:
             try:
-                data = os.read(fileDescriptor.fileno(), 2048)
-            except IOError:
+                data = os.read(fileDescriptor.fileno(), READ_SIZE)
+            except BlockingIOError:
                 break
-            self.output += data
-            time.sleep(0.1)
+            if not data:
+                self.selector.unregister(fileDescriptor)
+                self.outputClosed = True
+                break
+            self.parser.feed(data)
+            self.onOutput(data)
 
-    def logOutput(self):
-        output = self.output.decode('ascii')
-        for line in output.splitlines():
-            self.logger.info(f"OUT: {line}")
+    def logOutput(self, data: bytes) -> None:
+        # The LogWriter splits the output into lines in its own thread.
+        self.logger.info(AdapterOutput(data))
 
-    def sendInput(self, message: str) -> None:
-        self.logger.info(f"IN: {message.splitlines()[0]}")
-        self.process.stdin.writelines([message])
+    def close(self) -> None:
+        self._setWriting(False)
+        self.input.clear()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def sendInput(self, message: str, log: bool = True) -> None:
+        if log:
+            self.logger.info(f"IN: {message.splitlines()[0]}")
+        self.input += message.encode('ascii', errors='replace')
+        self.writeInput()
+
+    def writeInput(self) -> None:
+        try:
+            while self.input:
+                written = os.write(self.process.stdin.fileno(), self.input)
+                del self.input[:written]
+        except BlockingIOError:
+            pass
+        except (OSError, ValueError):
+            # The adapter is gone, its exit is handled when its output ends.
+            self.input.clear()
+        self._setWriting(bool(self.input))
+
+    def _setWriting(self, writing: bool) -> None:
+        if writing != self.writing:
+            if writing:
+                self.selector.register(self.process.stdin, selectors.EVENT_WRITE,
+                                       (self.owner, StreamType.ADAPTER_INPUT))
+            else:
+                self.selector.unregister(self.process.stdin)
+            self.writing = writing
 
     def stop(self) -> None:
-        if self.isRunning:
+        # Stops the adapter without the event loop, when the service ends
+        # because of an unexpected error. Normally StopPhase is used instead.
+        if self.isRunning and self.process.poll() is None:
             self.logger.info('Stopping JMS Adapter')
-            self.sendInput("e")
+            os.set_blocking(self.process.stdin.fileno(), True)
+            self.sendInput("e\n")
             try:
-                self.process.wait(5)
+                self.process.wait(self.instance.stopTimeout)
                 self.logger.info('JMS Adapter stopped')
             except subprocess.TimeoutExpired:
                 self.logger.warning("Timeout stopping JMS Adapter - Terminating")
-                self.process.terminate()
+                self.sendSignal(signal.SIGTERM)
                 try:
-                    self.process.wait(5)
+                    self.process.wait(self.instance.terminateTimeout)
                     self.logger.info('JMS Adapter terminated')
                 except subprocess.TimeoutExpired:
                     self.logger.error("Timeout terminating JMS Adapter - Sending Kill signal")
-                    self.process.kill()
+                    self.sendSignal(signal.SIGKILL)
         else:
             self.logger.info("Adapter has shut down")
 
 
+class CommandSource:
+    # Something that sends commands to the adapter and receives their responses.
+    # Each source has its own queue of input lines, which are handled in order.
+    # The commands of quiet sources and their output are not logged.
+    def __init__(self, quiet: bool = False):
+        self.lines: deque[str] = deque()
+        self.busy = False
+        self.continuation = False
+        self.quiet = quiet
+        self.closed = False
+
+    def deliver(self, data: bytes) -> None:
+        pass
+
+    def complete(self, status: ResponseStatus) -> None:
+        pass
+
+    def reply(self, data: bytes, status: ResponseStatus = ResponseStatus.OK) -> None:
+        self.deliver(data)
+        self.complete(status)
+
+
+class InternalSource(CommandSource):
+    # Commands issued by the service itself. The output is not kept, the service
+    # picks up what it needs from the records of the OutputParser.
+    def __init__(self, onComplete: Callable[[ResponseStatus], None], quiet: bool = True):
+        super().__init__(quiet)
+        self.onComplete = onComplete
+
+    def complete(self, status: ResponseStatus) -> None:
+        self.onComplete(status)
+
+    def send(self, command: str) -> None:
+        self.lines.append(command + '\n')
+
+
+class CachedOutput:
+    # The time the service last parsed one kind of adapter output, and the
+    # internal command that refreshes it for the sources waiting on it.
+    def __init__(self, command: str, onComplete: Callable[[ResponseStatus], None]):
+        self.command = command
+        self.source = InternalSource(onComplete)
+        self.updated = 0.0
+        self.waiters: list[tuple[CommandSource, Callable[[], bytes]]] = []
+
+
+class ControlClient(CommandSource):
+    def __init__(self, clientSocket: socket.socket, address, maxOutputBuffer: int):
+        super().__init__()
+        self.socket = clientSocket
+        self.address = address
+        self.output = RelayBuffer(maxOutputBuffer)
+        self.input = bytearray()
+        self.writing = False
+        self.subscribed = False
+        # The framing of the responses, None for the raw output of the adapter.
+        self.encodeFrame: Callable[[str, bytes], bytes] = None
+        # Reads the REQUEST frames once the client switched to the binary framing.
+        self.requests: controlprotocol.BinaryFrameReader = None
+
+    @property
+    def framed(self) -> bool:
+        return self.encodeFrame is not None
+
+    def deliver(self, data: bytes) -> None:
+        if self.encodeFrame:
+            self.output.append(self.encodeFrame(controlprotocol.MORE, data))
+        else:
+            self.output.append(data)
+
+    def complete(self, status: ResponseStatus) -> None:
+        if self.encodeFrame:
+            self.output.append(self.encodeFrame(status.value, b''))
+
+    def reply(self, data: bytes, status: ResponseStatus = ResponseStatus.OK) -> None:
+        if self.encodeFrame:
+            self.output.append(self.encodeFrame(status.value, data))
+        else:
+            self.output.append(data)
+
+
+class Command:
+    def __init__(self, source: CommandSource, line: str):
+        self.source = source
+        self.line = line
+        self.started = time.monotonic()
+        self.lastOutput = self.started
+        self.tail = b''
+        # The line answers a prompt of the adapter rather than being a command.
+        self.answer = source.continuation
+
+
 class JmsAdapterManager:
-    def __init__(self, config: adapterconfig.AdapterConfig, logger: logging.Logger):
-        self.config = config
-        self.brokerName = config.instance.brokerName
-        self.controlPort = config.instance.controlPort
+    # Runs one broker instance: its adapter process, control port and health
+    # port. The selector and the timers are shared by all instances.
+    def __init__(self, instance: adapterconfig.AdapterInstance, logger: logging.Logger,
+                 selector: selectors.BaseSelector, timers: TimerQueue, loopStats: LoopStats = None):
+        self.instance = instance
+        self.brokerName = instance.brokerName
+        self.controlPort = instance.controlPort
+        self.hostname = platform.uname().node
         self.logger = logger
-        self.selector = selectors.DefaultSelector()
+        self.selector = selector
+        self.timers = timers
         self.adapterProcess: AdapterProcess = None
+        # The adapter accepts commands once it printed its first menu.
+        self.ready = False
+        self.readyTimer: Timer = None
+        self.startedAt = 0.0
+        self.startupSeconds = 0.0
+        # A stop requested with E or A is not restarted.
+        self.stopRequested = False
+        self.restartTimer: Timer = None
+        self.restarts = 0
+        self.crashes: deque[float] = deque()
+        self.failed = False
+        self.stopPhase: StopPhase = None
+        self.stopTimer: Timer = None
+        self.onStopped: Callable[[], None] = None
+        self.shuttingDown = False
         self.serverSocket: socket.socket = None
-        self.clientSocket: socket.socket = None
+        self.unixSocket: socket.socket = None
+        self.healthSocket: socket.socket = None
+        self.clients: dict[socket.socket, ControlClient] = {}
+        self.waiting: deque[CommandSource] = deque()
+        self.activeCommand: Command = None
+        self.heldBy: CommandSource = None
+        self.idleTimer: Timer = None
+        self.commandTimer: Timer = None
+        self.holdTimer: Timer = None
+        self.cached = {
+            name: CachedOutput(command, lambda status, name=name: self._onRefreshed(name, status))
+            for name, command in (("summary", "s"), ("servers", "d"), ("connections", "l"), ("properties", "y"))
+        }
+        self.servers: list[adapteroutput.ServerRecord] = []
+        self.pendingServers: list[adapteroutput.ServerRecord] = []
+        self.connections: list[adapteroutput.ConnectionRecord] = []
+        self.pendingConnections: list[adapteroutput.ConnectionRecord] = []
+        self.connectionIndex = ConnectionIndex(instance.connectionStallSeconds)
+        self.processSampler: ProcessSampler = None
+        self.processSample: dict = {}
+        self.heapPressure = False
+        self.sampleWithPoll = False
+        self.properties: dict[str, str] = {}
+        self.pendingProperties: dict[str, str] = {}
+        self.brokerProperties = {}
+        self.snapshot: dict = None
+        self.snapshotJson = b''
+        self.exporter: MetricsExporter = None
+        self.history = MetricsHistory(instance.historySize) if instance.historySize > 0 else None
+        # Only the Summary of the periodic poll is added to the history, so its
+        # span does not depend on how often clients ask for one.
+        self.historyPending = False
+        self.scrollback = (Scrollback(instance.scrollbackBytes, instance.scrollbackLines)
+                           if instance.scrollbackBytes > 0 and instance.scrollbackLines > 0 else None)
+        self.autoscaler: Autoscaler = None
+        # The X and T commands of the autoscaler are logged like those of a client.
+        self.scaleSource = InternalSource(self._onScaled, quiet=False)
+        # Answers a prompt with an empty line when its source is gone.
+        self.promptCanceller = InternalSource(lambda status: None)
+        self.autoscalePending = False
+        self.autoscaledSnapshot = 0.0
+        self.stats: InstanceStats = None
+        if instance.stats:
+            writers = [handler for handler in logger.handlers if isinstance(handler, LogWriter)]
+            self.stats = InstanceStats(loopStats or LoopStats(), writers[0].writeTime if writers else None)
+        self.verbs = {
+            "follow": self._verbFollow,
+            "tail": self._verbTail,
+            "since": self._verbSince,
+            "framed": self._verbFramed,
+            "json": self._verbJson,
+            "metrics": self._verbMetrics,
+            "history": self._verbHistory,
+            "servers": self._verbServers,
+            "connections": self._verbConnections,
+            "conn": self._verbConn,
+            "conns": self._verbConns,
+            "conndiff": self._verbConnDiff,
+            "properties": self._verbProperties,
+            "restart": self._verbRestart,
+            "autoscale": self._verbAutoscale,
+            "status": self._verbStatus,
+            "stats": self._verbStats,
+            "process": self._verbProcess,
+        }
+
+    @property
+    def isRunning(self) -> bool:
+        return self.adapterProcess is not None and self.adapterProcess.isRunning
+
+    @property
+    def isActive(self) -> bool:
+        # Running, or waiting to restart the adapter after a failure.
+        return self.isRunning or self.restartTimer is not None
 
     def _setupServerSocket(self) -> None:
-        self.logger.info(f"Setting up controller on localhost:{self.controlPort}")
+        if self.controlPort:
+            self.logger.info(f"Setting up controller on localhost:{self.controlPort}")
+            self.serverSocket = self._listen(self.controlPort, StreamType.SERVER)
+        if self.instance.controlSocket:
+            self.logger.info(f"Setting up controller on {self.instance.controlSocket}")
+            self.unixSocket = self._listenUnix(self.instance.controlSocket)
+        if self.instance.healthPort:
+            self.logger.info(f"Setting up health check on localhost:{self.instance.healthPort}")
+            self.healthSocket = self._listen(self.instance.healthPort, StreamType.HEALTH)
+
+    def _listen(self, port: int, streamType: StreamType) -> socket.socket:
         serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        serverSocket.bind(('127.0.0.1', self.controlPort))
+        serverSocket.bind(('127.0.0.1', port))
         serverSocket.listen()
         serverSocket.setblocking(False)
-        self.selector.register(serverSocket, selectors.EVENT_READ, StreamType.SERVER)
-        self.serverSocket = serverSocket
+        self.selector.register(serverSocket, selectors.EVENT_READ, (self, streamType))
+        return serverSocket
+
+    def _listenUnix(self, path: str) -> socket.socket:
+        # Access to the socket is controlled by its file permissions.
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise OSError(errno.EEXIST, f"{path} exists and is not a socket")
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+                raise OSError(errno.EADDRINUSE, f"{path} is in use by another service")
+            except ConnectionRefusedError:
+                # Left behind by a service that did not stop cleanly.
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            finally:
+                probe.close()
+        serverSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # The socket is created with its final permissions, so there is no
+        # moment at which others can connect to it.
+        umask = os.umask(0o777 & ~self.instance.controlSocketMode)
+        try:
+            serverSocket.bind(path)
+        finally:
+            os.umask(umask)
+        serverSocket.listen()
+        serverSocket.setblocking(False)
+        self.selector.register(serverSocket, selectors.EVENT_READ, (self, StreamType.SERVER))
+        return serverSocket
+
+    def _answerHealthCheck(self) -> None:
+        # Sends a single status byte and closes the connection, without reading
+        # anything from the client.
+        try:
+            client, _ = self.healthSocket.accept()
+        except BlockingIOError:
+            return
+        try:
+            client.send(self._healthStatus().value)
+        except OSError:
+            pass
+        client.close()
+
+    def _healthStatus(self) -> HealthStatus:
+        if self.adapterProcess is None or not self.adapterProcess.isRunning:
+            return HealthStatus.DOWN
+        # A snapshot that missed several polls does not reflect the adapter anymore.
+        maxAge = max(self.instance.metricsInterval, 1) * 3
+        if (self.snapshot and self.snapshot["brokerStatus"] == "ACTIVE"
+                and time.time() - self.snapshot["timestamp"] <= maxAge):
+            return HealthStatus.ACTIVE
+        return HealthStatus.RUNNING
 
     def _startAdapter(self) -> None:
-        self.adapterProcess = AdapterProcess(self.config, self.logger)
-        self.adapterProcess.run(self.selector)
+        self.ready = False
+        self.stopRequested = False
+        self.startedAt = time.monotonic()
+        # Listings cut short by the previous adapter are not completed by this one.
+        self.pendingServers = []
+        self.pendingConnections = []
+        self.pendingProperties = {}
+        self.adapterProcess = AdapterProcess(self.instance, self.logger, self._routeOutput, self._onRecord)
+        self.adapterProcess.run(self.selector, self)
+        if self.instance.readyTimeout > 0:
+            self.readyTimer = self.timers.schedule(self.instance.readyTimeout, self._readyTimedOut)
+
+    def _onReady(self) -> None:
+        self.ready = True
+        if self.readyTimer:
+            self.readyTimer.cancel()
+            self.readyTimer = None
+        self.startupSeconds = round(time.monotonic() - self.startedAt, 3)
+        self.logger.info(f"Adapter ready after {self.startupSeconds} seconds")
+
+    def _readyTimedOut(self) -> None:
+        self.readyTimer = None
+        if not self.ready and self.isRunning:
+            self.logger.error(f"The adapter is not ready after {self.instance.readyTimeout} seconds: terminating it")
+            # Its exit is handled like any other failure.
+            self.adapterProcess.sendSignal(signal.SIGTERM)
+
+    def _stopAdapter(self, onStopped: Callable[[], None] = None) -> None:
+        # Asks the adapter to exit, and escalates to SIGTERM and SIGKILL when it
+        # has not exited at the end of each phase. The event loop keeps running
+        # meanwhile, so the output of the adapter is still logged and clients
+        # are still answered.
+        self.stopRequested = True
+        self.onStopped = onStopped
+        if self.readyTimer:
+            self.readyTimer.cancel()
+            self.readyTimer = None
+        if self.stopPhase:
+            return
+        self.logger.info('Stopping JMS Adapter')
+        self._failActiveCommand()
+        self.stopPhase = StopPhase.EXIT
+        self.adapterProcess.sendInput("e\n")
+        self.stopTimer = self.timers.schedule(self.instance.stopTimeout, self._stopPhaseExpired)
+
+    def _stopPhaseExpired(self) -> None:
+        self.stopTimer = None
+        match self.stopPhase:
+            case StopPhase.EXIT:
+                self.logger.warning("Timeout stopping JMS Adapter - Terminating")
+                self.adapterProcess.sendSignal(signal.SIGTERM)
+                self.stopPhase = StopPhase.TERMINATE
+                self.stopTimer = self.timers.schedule(self.instance.terminateTimeout, self._stopPhaseExpired)
+            case StopPhase.TERMINATE:
+                self.logger.error("Timeout terminating JMS Adapter - Sending Kill signal")
+                self.adapterProcess.sendSignal(signal.SIGKILL)
+                self.stopPhase = StopPhase.KILL
+
+    def _onAdapterExit(self) -> None:
+        # The process has exited and all of its output has been read.
+        exitCode = self.adapterProcess.exitCode
+        self.adapterProcess.close()
+        if self.readyTimer:
+            self.readyTimer.cancel()
+            self.readyTimer = None
+        self._markOffline()
+        if self.stopPhase:
+            if self.stopTimer:
+                self.stopTimer.cancel()
+                self.stopTimer = None
+            self.logger.info({StopPhase.EXIT: 'JMS Adapter stopped', StopPhase.TERMINATE: 'JMS Adapter terminated',
+                              StopPhase.KILL: 'JMS Adapter killed'}[self.stopPhase])
+            self.stopPhase = None
+            onStopped = self.onStopped
+            self.onStopped = None
+            if onStopped:
+                self._failActiveCommand()
+                onStopped()
+            else:
+                self._onAdapterStopped()
+            return
+        if self.stopRequested or not self.instance.restartOnFailure:
+            if not self.stopRequested:
+                self.adapterProcess.logExit(exitCode)
+            self.logger.info("Adapter has shut down")
+            self._onAdapterStopped()
+            return
+        self.adapterProcess.logExit(exitCode)
+        now = time.monotonic()
+        self.crashes.append(now)
+        while self.crashes[0] < now - self.instance.crashLoopWindow:
+            self.crashes.popleft()
+        if len(self.crashes) >= self.instance.crashLoopLimit:
+            self.logger.critical(f"The adapter failed {len(self.crashes)} times within"
+                                 f" {self.instance.crashLoopWindow} seconds: not restarting it")
+            self.failed = True
+            self._onAdapterStopped()
+            return
+        # The delay doubles with every failure within the crash loop window.
+        delay = min(self.instance.restartDelay * 2 ** (len(self.crashes) - 1), self.instance.restartDelayMax)
+        self.logger.warning(f"Restarting the adapter in {delay} seconds")
+        # The commands that are waiting are sent to the restarted adapter.
+        self.restartTimer = self.timers.schedule(delay, self._restartAdapter)
+        self._failActiveCommand()
+
+    def _restartAdapter(self) -> None:
+        self.restartTimer = None
+        self.restarts += 1
+        self._startAdapter()
+
+    def beginShutdown(self) -> None:
+        self.shuttingDown = True
+        if self.restartTimer:
+            self.restartTimer.cancel()
+            self.restartTimer = None
+        if self.isRunning:
+            self._stopAdapter()
+        else:
+            self._onAdapterStopped()
+
+    def _failActiveCommand(self) -> None:
+        self.heldBy = None
+        if self.holdTimer:
+            self.holdTimer.cancel()
+            self.holdTimer = None
+        if self.activeCommand:
+            self._completeCommand(ResponseStatus.ERROR)
+
+    def _onAdapterStopped(self) -> None:
+        # Commands can not be answered anymore, neither the one in progress nor
+        # the ones that are waiting.
+        self._failActiveCommand()
+        waiting = list(self.waiting)
+        self.waiting.clear()
+        for source in waiting:
+            source.busy = False
+            self._processSource(source)
 
     def _acceptConnection(self, key) -> None:
         server = key.fileobj
-        self.selector.unregister(self.serverSocket)
-        client, address = server.accept()
+        try:
+            clientSocket, address = server.accept()
+        except BlockingIOError:
+            return
+        # Clients of the control socket have no address of their own.
+        address = address or self.instance.controlSocket
         self.logger.info(f"Accepting client connection on {address}")
-        client.setblocking(False)
-        self.clientSocket = client
-        self.selector.register(client, selectors.EVENT_READ, StreamType.CLIENT)
+        if self.stats:
+            self.stats.connects += 1
+        clientSocket.setblocking(False)
+        if clientSocket.family == socket.AF_INET:
+            # Responses are often written in several pieces; do not hold back
+            # the last one until the client acknowledges the previous one.
+            clientSocket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.clients[clientSocket] = ControlClient(clientSocket, address, self.instance.maxOutputBuffer)
+        self.selector.register(clientSocket, selectors.EVENT_READ, (self, StreamType.CLIENT))
 
-    def _readClient(self) -> None:
-        client = self.clientSocket
+    def _readClient(self, client: ControlClient) -> None:
         try:
-            data = client.recv(64)
-            if data:
-                self.adapterProcess.sendInput(data.decode('ascii'))
+            data = client.socket.recv(READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._deregisterClient(client)
+            return
+        if not data:
+            self.logger.info(f"Client {client.address} disconnected")
+            self._deregisterClient(client)
+            return
+        if client.subscribed:
+            return
+        if client.requests:
+            client.requests.feed(data)
+        else:
+            client.input += data
+            while (end := client.input.find(b'\n')) >= 0:
+                line = client.input[:end + 1].decode('ascii', errors='replace')
+                del client.input[:end + 1]
+                client.lines.append(line)
+                if line.strip().lower() == "json" and not client.continuation:
+                    # Whatever follows the verb is already in the binary framing.
+                    client.requests = controlprotocol.BinaryFrameReader(controlprotocol.MAX_REQUEST)
+                    client.requests.feed(client.input)
+                    client.input.clear()
+                    break
+        if client.requests:
+            try:
+                while frame := client.requests.nextFrame():
+                    status, payload = frame
+                    if status != controlprotocol.REQUEST:
+                        raise controlprotocol.ProtocolError(f"Unexpected {status} frame")
+                    client.lines.append(controlprotocol.decodeRequest(payload) + '\n')
+            except controlprotocol.ProtocolError as error:
+                self.logger.warning(f"Client {client.address} sent an invalid frame: {error}")
+                self._deregisterClient(client)
+                return
+        self._processSource(client)
+
+    def _processSource(self, source: CommandSource) -> None:
+        # Service verbs are answered immediately, but only once all the adapter
+        # commands queued before them by the same source have been answered.
+        while source.lines and not source.busy:
+            line = source.lines[0]
+            words = line.split()
+            if not source.continuation and words and words[0].lower() in self.verbs:
+                source.lines.popleft()
+                self.verbs[words[0].lower()](source, words[1:])
+                continue
+            if self.shuttingDown or not self.isActive:
+                source.lines.popleft()
+                source.reply(b'The adapter is stopping\n' if self.isActive else b'The adapter is not running\n',
+                             ResponseStatus.ERROR)
+                continue
+            source.busy = True
+            self.waiting.append(source)
+        if isinstance(source, ControlClient):
+            self._flushClient(source)
+        self._dispatchCommand()
+
+    def _dispatchCommand(self) -> None:
+        if (self.activeCommand or not self.waiting or not self.ready or self.stopPhase
+                or not self.adapterProcess.isRunning):
+            return
+        if self.heldBy:
+            # The adapter is waiting for the answer to a prompt it gave to this source.
+            if self.heldBy not in self.waiting:
+                return
+            source = self.heldBy
+            self.waiting.remove(source)
+        else:
+            source = self.waiting.popleft()
+        line = source.lines.popleft()
+        self.heldBy = None
+        if self.holdTimer:
+            self.holdTimer.cancel()
+            self.holdTimer = None
+        self.activeCommand = Command(source, line)
+        if not source.continuation and line.strip().lower() in ("e", "a"):
+            self.stopRequested = True
+        if self._listingProperties():
+            self.pendingProperties = {}
+        self.commandTimer = self.timers.schedule(self.instance.commandTimeout, self._commandTimedOut)
+        if self.stats:
+            self.stats.adapterBytesWritten += len(line)
+        self.adapterProcess.sendInput(line, not source.quiet)
+
+    def _completeCommand(self, status: ResponseStatus) -> None:
+        command = self.activeCommand
+        self.activeCommand = None
+        for timer in (self.idleTimer, self.commandTimer):
+            if timer:
+                timer.cancel()
+        self.idleTimer = None
+        self.commandTimer = None
+        if self.stats:
+            name = "answer" if command.answer else (command.line.strip().lower()[:1] or "enter")
+            self.stats.commandCompleted(name, command.started, status == ResponseStatus.TIMEOUT,
+                                        status == ResponseStatus.ERROR)
+        source = command.source
+        if source is None:
+            if status == ResponseStatus.PROMPT:
+                self._cancelPrompt()
+            self._dispatchCommand()
+            return
+        source.busy = False
+        source.continuation = status == ResponseStatus.PROMPT
+        if source.continuation:
+            self.heldBy = source
+            self.holdTimer = self.timers.schedule(self.instance.commandTimeout, self._holdExpired)
+        source.complete(status)
+        self._processSource(source)
+
+    def _commandTimedOut(self) -> None:
+        if self.activeCommand:
+            self.logger.warning(f"No complete response to {self.activeCommand.line.strip()!r}"
+                                f" after {self.instance.commandTimeout} seconds")
+            self._completeCommand(ResponseStatus.TIMEOUT)
+
+    def _holdExpired(self) -> None:
+        self.holdTimer = None
+        if self.heldBy:
+            self.logger.warning("No answer to the prompt of the adapter, accepting commands from other clients")
+            self.heldBy.continuation = False
+            if self.heldBy is self.promptCanceller:
+                # The adapter prompts again after the empty answer; give up.
+                self.heldBy = None
+                self._dispatchCommand()
             else:
-                self.logger.info("Client disconnected")
-                self.selector.unregister(client)
-                client.close()
-                self.selector.register(self.serverSocket, selectors.EVENT_READ, StreamType.SERVER)
+                self._cancelPrompt()
+
+    def _cancelPrompt(self) -> None:
+        # The adapter still waits at a prompt whose source is gone. It gets an
+        # empty answer first, so the next command is not taken as the answer.
+        self.heldBy = self.promptCanceller
+        self.promptCanceller.continuation = True
+        self.promptCanceller.send("")
+        self._processSource(self.promptCanceller)
+
+    def _checkPrompt(self) -> None:
+        # A response that stops without the menu, after a prompt the adapter did
+        # not end with a line ending, is the adapter waiting for more input, e.g.
+        # the number of servers to add. Any other pause is a slow response.
+        self.idleTimer = None
+        command = self.activeCommand
+        if command is None:
+            return
+        idle = time.monotonic() - command.lastOutput
+        if idle < PROMPT_IDLE:
+            self.idleTimer = self.timers.schedule(PROMPT_IDLE - idle, self._checkPrompt)
+        elif (command.tail and not command.tail.endswith(b'\n')
+              and adapteroutput.isPrompt(self.adapterProcess.parser.partial)):
+            self._completeCommand(ResponseStatus.PROMPT)
+
+    def _routeOutput(self, data: bytes) -> None:
+        if self.stats:
+            self.stats.adapterReads += 1
+            self.stats.adapterBytesRead += len(data)
+        while data:
+            command = self.activeCommand
+            if command is None:
+                self.adapterProcess.logOutput(data)
+                self._followOutput(data)
+                for client in self.clients.values():
+                    if not client.subscribed and not client.framed:
+                        client.deliver(data)
+                break
+            window = command.tail + data
+            index = window.find(MENU_END)
+            end = window.find(b'\n', index) if index >= 0 else -1
+            if end < 0:
+                self._deliverResponse(command, data)
+                # Keep enough of the output to find a menu split over two reads.
+                command.tail = window[index:] if index >= 0 else window[-len(MENU_END):]
+                command.lastOutput = time.monotonic()
+                if self.idleTimer is None:
+                    self.idleTimer = self.timers.schedule(PROMPT_IDLE, self._checkPrompt)
+                break
+            end += 1 - len(command.tail)
+            self._deliverResponse(command, data[:end])
+            data = data[end:]
+            self._completeCommand(ResponseStatus.OK)
+        for client in list(self.clients.values()):
+            self._flushClient(client)
+
+    def _deliverResponse(self, command: Command, data: bytes) -> None:
+        # The output of quiet commands, such as the poll of the Summary, is
+        # neither logged nor followed.
+        if command.source is None or not command.source.quiet:
+            self.adapterProcess.logOutput(data)
+            self._followOutput(data)
+        if command.source is not None:
+            command.source.deliver(data)
+
+    def _followOutput(self, data: bytes) -> None:
+        if self.scrollback:
+            # Everything a follower would have received.
+            self.scrollback.append(data)
+        for client in self.clients.values():
+            if client.subscribed:
+                client.deliver(data)
+
+    def _flushClient(self, client: ControlClient) -> None:
+        if client.closed:
+            return
+        try:
+            sent = client.output.sendTo(client.socket)
         except OSError:
-            self._deregisterClient()
+            self._deregisterClient(client)
+            return
+        dropped = client.output.takeDropped()
+        if self.stats:
+            self.stats.clientBytesSent += sent
+            self.stats.clientBytesDropped += dropped
+        if dropped and client.framed:
+            # Dropping part of a frame would corrupt the stream.
+            self.logger.warning(f"Client {client.address} is not keeping up: disconnecting")
+            self._deregisterClient(client)
+            return
+        if dropped:
+            self.logger.warning(f"Client {client.address} is not keeping up:"
+                                f" dropped {dropped} bytes of adapter output")
+        self._setClientWriting(client, bool(client.output))
+
+    def _setClientWriting(self, client: ControlClient, writing: bool) -> None:
+        # Only wait for the socket to become writable while output is pending,
+        # otherwise the selector would report it as ready on every iteration.
+        if writing != client.writing:
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE if writing else selectors.EVENT_READ
+            self.selector.modify(client.socket, events, (self, StreamType.CLIENT))
+            client.writing = writing
 
-    def _sendToClient(self):
-        client = self.clientSocket
-        self.adapterProcess.logOutput()
-        if client:
+    def _deregisterClient(self, client: ControlClient) -> None:
+        if client.closed:
+            return
+        client.closed = True
+        if self.stats:
+            self.stats.disconnects += 1
+        client.output.clear()
+        del self.clients[client.socket]
+        try:
+            self.selector.unregister(client.socket)
+        except (KeyError, ValueError):
+            pass
+        client.socket.close()
+        if client in self.waiting:
+            self.waiting.remove(client)
+        if self.activeCommand and self.activeCommand.source is client:
+            self.activeCommand.source = None
+        if self.heldBy is client:
+            self.logger.warning(f"Client {client.address} disconnected while the adapter was waiting for its input")
+            if self.holdTimer:
+                self.holdTimer.cancel()
+                self.holdTimer = None
+            self._cancelPrompt()
+
+    def _verbFollow(self, source: CommandSource, args: list) -> None:
+        # Optionally replays the given number of lines of the scrollback first.
+        if isinstance(source, ControlClient):
             try:
-                while self.adapterProcess.output:
-                    sent = client.send(self.adapterProcess.output)
-                    self.adapterProcess.output = self.adapterProcess.output[sent:]
+                replay = int(args[0]) if args else 0
+            except ValueError:
+                source.reply(b'Usage: follow [lines to replay]\n', ResponseStatus.ERROR)
+                return
+            self.logger.info(f"Client {source.address} is following the adapter output")
+            if replay > 0 and self.scrollback:
+                source.deliver(self.scrollback.tail(replay))
+            source.subscribed = True
+            source.lines.clear()
 
-            except OSError:
-                self._deregisterClient()
+    def _verbTail(self, source: CommandSource, args: list) -> None:
+        if self.scrollback is None:
+            source.reply(b'The scrollback is disabled\n', ResponseStatus.ERROR)
+            return
+        try:
+            count = int(args[0]) if args else 50
+        except ValueError:
+            source.reply(b'Usage: tail [lines]\n', ResponseStatus.ERROR)
+            return
+        source.reply(self.scrollback.tail(count))
+
+    def _verbSince(self, source: CommandSource, args: list) -> None:
+        if self.scrollback is None:
+            source.reply(b'The scrollback is disabled\n', ResponseStatus.ERROR)
+            return
+        try:
+            timestamp = scrollback.parseTime(args[0])
+        except (ValueError, IndexError):
+            source.reply(b'Usage: since <duration, e.g. 15m, or time, e.g. 09:15 or 2026-10-17T09:15>\n',
+                         ResponseStatus.ERROR)
+            return
+        source.reply(self.scrollback.since(timestamp))
+
+    def _verbFramed(self, source: CommandSource, args: list) -> None:
+        if isinstance(source, ControlClient):
+            source.encodeFrame = controlprotocol.encodeFrame
+            source.reply(b'')
+
+    def _verbJson(self, source: CommandSource, args: list) -> None:
+        # The client already sends REQUEST frames, see _readClient.
+        if isinstance(source, ControlClient):
+            source.encodeFrame = controlprotocol.encodeBinaryFrame
+            source.reply(b'')
+
+    def _verbMetrics(self, source: CommandSource, args: list) -> None:
+        # Answers from the cached snapshot, unless it is older than the maximum
+        # age in seconds given as argument (by default twice the poll interval).
+        self._answerCached(source, "summary", args, self.instance.metricsInterval * 2,
+                           lambda: self.snapshotJson)
+
+    def _verbServers(self, source: CommandSource, args: list) -> None:
+        self._answerCached(source, "servers", args, DEFAULT_MAX_AGE, lambda: self._renderRecords(
+            "servers", [vars(server) for server in self.servers]))
+
+    def _verbConnections(self, source: CommandSource, args: list) -> None:
+        self._answerCached(source, "connections", args, DEFAULT_MAX_AGE, lambda: self._renderRecords(
+            "connections", [vars(connection) for connection in self.connections]))
+
+    def _indexConnections(self) -> None:
+        first = not self.connectionIndex.updated
+        diff = self.connectionIndex.update(self.connections, self.cached["connections"].updated)
+        if not first and (diff["new"] or diff["closed"] or diff["stalled"]):
+            self.logger.info(f"Connections: {len(diff['new'])} new, {len(diff['closed'])} closed,"
+                             f" {len(diff['stalled'])} stalled, {len(self.connections)} in total")
+
+    def _verbConn(self, source: CommandSource, args: list) -> None:
+        # One connection by its connection or client ID, from the index.
+        if len(args) != 1:
+            source.reply(b'Usage: conn <connection or client ID>\n', ResponseStatus.ERROR)
+            return
+
+        def render() -> bytes:
+            connection = self.connectionIndex.lookup(args[0])
+            if connection is None:
+                return json.dumps({"timestamp": self.connectionIndex.updated, "connection": None}).encode('ascii') \
+                    + b'\n'
+            return json.dumps({"timestamp": self.connectionIndex.updated, "connection": connection.report(
+                time.time(), self.instance.connectionStallSeconds)}).encode('ascii') + b'\n'
+        self._answerCached(source, "connections", [], DEFAULT_MAX_AGE, render)
+
+    def _verbConns(self, source: CommandSource, args: list) -> None:
+        # The connections of the index, optionally filtered with "idle <seconds>",
+        # "queue <pattern>" and "stalled".
+        filters = {}
+        words = list(args)
+        try:
+            while words:
+                match words.pop(0).lower():
+                    case "idle":
+                        filters["idleOver"] = float(words.pop(0))
+                    case "queue":
+                        filters["queue"] = words.pop(0)
+                    case "stalled":
+                        filters["stalled"] = True
+                    case _:
+                        raise ValueError
+        except (ValueError, IndexError):
+            source.reply(b'Usage: conns [idle <seconds>] [queue <pattern>] [stalled]\n', ResponseStatus.ERROR)
+            return
+
+        def render() -> bytes:
+            connections = self.connectionIndex.select(time.time(), **filters)
+            return json.dumps({"timestamp": self.connectionIndex.updated, "count": len(connections),
+                               "connections": connections}).encode('ascii') + b'\n'
+        self._answerCached(source, "connections", [], DEFAULT_MAX_AGE, render)
+
+    def _verbConnDiff(self, source: CommandSource, args: list) -> None:
+        # The connections that are new, closed or stalled since the listing before the last one.
+        self._answerCached(source, "connections", args, DEFAULT_MAX_AGE,
+                           lambda: json.dumps(self.connectionIndex.diff).encode('ascii') + b'\n')
+
+    def _verbProperties(self, source: CommandSource, args: list) -> None:
+        # Lists the properties from the last Y output, optionally only those
+        # starting with the given prefix. A property name never starts with a
+        # digit, so such an argument is the maximum age.
+        prefix = args.pop(0) if args and not args[0][:1].isdigit() else ''
+
+        def render() -> bytes:
+            return self._renderRecords("properties", {name: value for name, value in self.properties.items()
+                                                      if name.startswith(prefix)})
+        self._answerCached(source, "properties", args, PROPERTIES_MAX_AGE, render)
+
+    def _renderRecords(self, name: str, records) -> bytes:
+        return json.dumps({"timestamp": self.cached[name].updated, name: records}).encode('ascii') + b'\n'
+
+    def _answerCached(self, source: CommandSource, name: str, args: list, defaultMaxAge: float,
+                      render: Callable[[], bytes]) -> None:
+        cached = self.cached[name]
+        try:
+            maxAge = float(args[0]) if args else defaultMaxAge
+        except ValueError:
+            source.reply(b'Usage: <command> [maximum age in seconds]\n', ResponseStatus.ERROR)
+            return
+        if cached.updated and time.time() - cached.updated <= maxAge:
+            source.reply(render())
+            return
+        if not self.isRunning:
+            # The adapter may not be back before the end of the restart delay,
+            # so the last output is the answer, however old it is.
+            if cached.updated:
+                source.reply(render())
+            else:
+                source.reply(f'No {name} available\n'.encode('ascii'), ResponseStatus.ERROR)
+            return
+        # The source waits for the reply, so that its next commands are answered in order.
+        source.busy = True
+        cached.waiters.append((source, render))
+        self._refresh(name)
+
+    def _refresh(self, name: str) -> None:
+        cached = self.cached[name]
+        if not cached.source.busy and not cached.source.lines:
+            cached.source.send(cached.command)
+            self._processSource(cached.source)
+
+    def _onRefreshed(self, name: str, status: ResponseStatus) -> None:
+        cached = self.cached[name]
+        waiters = cached.waiters
+        cached.waiters = []
+        for source, render in waiters:
+            if source.closed:
+                continue
+            source.busy = False
+            if cached.updated:
+                source.reply(render())
+            else:
+                source.reply(f'No {name} available\n'.encode('ascii'), ResponseStatus.ERROR)
+            self._processSource(source)
+
+    def _onRecord(self, record) -> None:
+        match record:
+            case adapteroutput.MenuRecord() if not self.ready:
+                self._onReady()
+            case adapteroutput.SummaryRecord():
+                self._updateSnapshot(record.fields)
+            case adapteroutput.ServerRecord():
+                self.pendingServers.append(record)
+            case adapteroutput.ConnectionRecord():
+                self.pendingConnections.append(record)
+            case adapteroutput.PropertyRecord() if self._listingProperties():
+                self.pendingProperties[record.name] = record.value
+            case adapteroutput.MenuRecord() if self._listingProperties():
+                self.properties = self.pendingProperties
+                self.pendingProperties = {}
+                self.cached["properties"].updated = time.time()
+            case adapteroutput.SectionEnd() if record.kind is adapteroutput.ServerRecord:
+                self.servers = self.pendingServers
+                self.pendingServers = []
+                self.cached["servers"].updated = time.time()
+            case adapteroutput.SectionEnd() if record.kind is adapteroutput.ConnectionRecord:
+                self.connections = self.pendingConnections
+                self.pendingConnections = []
+                self.cached["connections"].updated = time.time()
+                self._indexConnections()
+
+    def _listingProperties(self) -> bool:
+        # Only a complete Y listing replaces the properties; the single property
+        # of a Z does not.
+        command = self.activeCommand
+        return command is not None and not command.answer and command.line.strip().lower() == "y"
+
+    def _autoscaleTick(self) -> None:
+        self.timers.schedule(self.autoscaler.interval, self._autoscaleTick)
+        if self.autoscaler.paused or not self.ready:
+            return
+        snapshot = self.snapshot
+        if (snapshot and snapshot["timestamp"] > self.autoscaledSnapshot
+                and time.time() - snapshot["timestamp"] <= self.autoscaler.interval):
+            self._autoscale()
+        else:
+            # Decide on a new Summary rather than on one that was already used.
+            self.autoscalePending = True
+            self._refresh("summary")
+
+    def _autoscale(self) -> None:
+        if self.scaleSource.busy or self.scaleSource.lines:
+            return
+        self.autoscaledSnapshot = self.snapshot["timestamp"]
+        change, reason = self.autoscaler.evaluate(self.snapshot, time.monotonic())
+        if not change:
+            return
+        if change > 0:
+            self.logger.info(f"Autoscaling: adding {change} server(s): {reason}")
+            self.scaleSource.send("x")
+        else:
+            self.logger.info(f"Autoscaling: trimming {-change} server(s): {reason}")
+            self.scaleSource.send("t")
+        # The number of servers is the answer to the prompt of X or T.
+        self.scaleSource.send(str(abs(change)))
+        self.autoscaler.applied(change, reason, time.monotonic(), time.time())
+        self._processSource(self.scaleSource)
+
+    def _onScaled(self, status: ResponseStatus) -> None:
+        if status in (ResponseStatus.TIMEOUT, ResponseStatus.ERROR):
+            self.logger.warning(f"Autoscaling command ended with {status.name}")
+            self.scaleSource.lines.clear()
+
+    def _verbAutoscale(self, source: CommandSource, args: list) -> None:
+        if self.autoscaler is None:
+            source.reply(b'Autoscaling is not configured\n', ResponseStatus.ERROR)
+            return
+        if args and args[0].lower() in ("pause", "resume"):
+            self.autoscaler.paused = args[0].lower() == "pause"
+            self.logger.info(f"Autoscaling {'paused' if self.autoscaler.paused else 'resumed'}")
+        elif args:
+            source.reply(b'Usage: autoscale [pause|resume]\n', ResponseStatus.ERROR)
+            return
+        source.reply(json.dumps(self.autoscaler.status()).encode('ascii') + b'\n')
+
+    def _updateSnapshot(self, summary: dict) -> None:
+        self.snapshot = {
+            "hostname": self.hostname,
+            "brokerName": self.brokerName,
+            "status": "Online",
+            "timestamp": time.time(),
+        }
+        self.snapshot.update(summary)
+        self.snapshot.update(self.brokerProperties)
+        self.snapshot.update(self.processSample)
+        self.snapshot["startupSeconds"] = self.startupSeconds
+        self.snapshot["restarts"] = self.restarts
+        self.snapshotJson = json.dumps(self.snapshot).encode('ascii') + b'\n'
+        self.cached["summary"].updated = self.snapshot["timestamp"]
+        if self.exporter:
+            self.exporter.update(self.brokerName, self.snapshot)
+        if self.history and self.historyPending:
+            self.historyPending = False
+            self.history.add(self.snapshot)
+        if self.autoscalePending:
+            # Records are parsed before the output is routed, so the commands
+            # are only queued once the current response has been handled.
+            self.autoscalePending = False
+            self.timers.schedule(0, self._autoscale)
+
+    def _markOffline(self) -> None:
+        # The last Summary describes an adapter that is gone. Its fields are
+        # kept, with the time it was taken, but clients and the exporter see
+        # the broker as down until the next Summary.
+        gone = {"brokerStatus", *self.processSample}
+        self.processSample = {}
+        self.snapshot = {name: value for name, value in (self.snapshot or {}).items() if name not in gone}
+        self.snapshot.update({
+            "hostname": self.hostname,
+            "brokerName": self.brokerName,
+            "status": "Offline",
+            "timestamp": self.snapshot.get("timestamp", 0.0),
+            "restarts": self.restarts,
+        })
+        self.snapshotJson = json.dumps(self.snapshot).encode('ascii') + b'\n'
+        if self.exporter:
+            self.exporter.update(self.brokerName, self.snapshot)
+
+    def _verbHistory(self, source: CommandSource, args: list) -> None:
+        if self.history is None:
+            source.reply(b'The metrics history is disabled\n', ResponseStatus.ERROR)
+            return
+        try:
+            seconds = history.parseDuration(args[0] if args else "15m")
+        except ValueError:
+            source.reply(b'Usage: history [window, e.g. 90s, 15m, 1h or 1d]\n', ResponseStatus.ERROR)
+            return
+        source.reply(json.dumps(self.history.summarize(seconds)).encode('ascii') + b'\n')
+
+    def _pollSummary(self) -> None:
+        if self.sampleWithPoll:
+            self._sampleProcess()
+        self.historyPending = True
+        self._refresh("summary")
+        self.timers.schedule(self.instance.metricsInterval, self._pollSummary)
+
+    def _sampleTick(self) -> None:
+        self.timers.schedule(self.instance.processSampleInterval, self._sampleTick)
+        self._sampleProcess()
+
+    def _sampleProcess(self) -> None:
+        if not self.adapterProcess or not self.adapterProcess.isRunning:
+            self.processSample = {}
+            return
+        pid = self.adapterProcess.process.pid
+        if self.processSampler is None or self.processSampler.pid != pid:
+            self.processSampler = ProcessSampler(pid, processsampler.parseHeapLimit(self.instance.jvmArgs),
+                                                 self.instance.heapWarningRatio)
+        self.processSample = self.processSampler.collect()
+        heapPressure = self.processSample.get("heapPressure", False)
+        if heapPressure and not self.heapPressure:
+            self.logger.warning(f"The JVM uses {self.processSample['jvmRssBytes'] // 1048576} MiB of memory,"
+                                f" close to its maximum heap of {self.processSample['heapMaxBytes'] // 1048576} MiB")
+        self.heapPressure = heapPressure
+
+    def _verbProcess(self, source: CommandSource, args: list) -> None:
+        if self.instance.processSampleInterval <= 0:
+            source.reply(b'The process sampling is disabled\n', ResponseStatus.ERROR)
+            return
+        if self.processSampler is None or not self.processSample:
+            source.reply(b'The adapter process has not been sampled yet\n', ResponseStatus.ERROR)
+            return
+        source.reply(json.dumps(self.processSampler.report()).encode('ascii') + b'\n')
+
+    def _verbRestart(self, source: CommandSource, args: list) -> None:
+        if self.shuttingDown:
+            source.reply(b'The service is shutting down\n', ResponseStatus.ERROR)
+            return
+        self.logger.info("Restarting the adapter")
+        # A restart on request also resets the crash loop breaker.
+        self.crashes.clear()
+        self.failed = False
+        if self.restartTimer:
+            self.restartTimer.cancel()
+            self.restartTimer = None
+
+        def restart() -> None:
+            self.restarts += 1
+            self._startAdapter()
+            source.reply(b'The adapter has been restarted\n')
+
+        if not self.isRunning:
+            restart()
+            return
+
+        def restartAfterStop() -> None:
+            restart()
+            source.busy = False
+            if not source.closed:
+                self._processSource(source)
+        # The source waits for the restart, so that its next commands go to the new adapter.
+        source.busy = True
+        self._stopAdapter(restartAfterStop)
+
+    def _verbStatus(self, source: CommandSource, args: list) -> None:
+        if self.stopPhase:
+            state = "stopping"
+        elif self.isRunning:
+            state = "ready" if self.ready else "starting"
+        elif self.restartTimer:
+            state = "restarting"
         else:
-            self.adapterProcess.output = b''
+            state = "failed" if self.failed else "stopped"
+        status = {
+            "brokerName": self.brokerName,
+            "state": state,
+            "stopPhase": self.stopPhase.value if self.stopPhase else None,
+            "shuttingDown": self.shuttingDown,
+            "pid": self.adapterProcess.process.pid if self.isRunning else None,
+            "startupSeconds": self.startupSeconds,
+            "restarts": self.restarts,
+            "clients": len(self.clients),
+            "waiting": len(self.waiting),
+        }
+        source.reply(json.dumps(status).encode('ascii') + b'\n')
+
+    def _verbStats(self, source: CommandSource, args: list) -> None:
+        if self.stats is None:
+            source.reply(b'The statistics are disabled, set "stats" in the configuration\n', ResponseStatus.ERROR)
+            return
+        source.reply(json.dumps(self.stats.report()).encode('ascii') + b'\n')
+
+    def _logStats(self) -> None:
+        self.logger.info(self.stats.summaryLine())
+        self.timers.schedule(self.instance.statsLogInterval, self._logStats)
 
-    def _deregisterClient(self):
-        client = self.clientSocket
-        if client:
-            self.clientSocket = None
+    def start(self, exporter: MetricsExporter) -> None:
+        self.exporter = exporter
+        self._setupServerSocket()
+        self.brokerProperties = adapterconfig.readBrokerProperties(self.instance)
+        self._startAdapter()
+        if self.instance.metricsInterval > 0:
+            self.timers.schedule(0, self._pollSummary)
+        if self.instance.autoscale:
             try:
-                self.selector.unregister(client)
-            except ValueError:
-                pass
+                self.autoscaler = Autoscaler(self.instance.autoscale, self.brokerProperties["maxAdptrThreads"])
+            except ValueError as e:
+                self.logger.error(f"Autoscaling is disabled: {e}")
+            else:
+                self.timers.schedule(self.autoscaler.interval, self._autoscaleTick)
+        if self.stats and self.instance.statsLogInterval > 0:
+            self.timers.schedule(self.instance.statsLogInterval, self._logStats)
+        if self.instance.processSampleInterval > 0 and sys.platform.startswith("linux"):
+            # At the same interval, the poll of the Summary also takes the sample,
+            # which saves the service a wakeup.
+            if self.instance.processSampleInterval == self.instance.metricsInterval:
+                self.sampleWithPoll = True
+            else:
+                self.timers.schedule(min(1, self.instance.processSampleInterval), self._sampleTick)
+
+    def _isStale(self, streamType: StreamType, key: selectors.SelectorKey) -> bool:
+        # An earlier event of the same select() batch may have closed the stream,
+        # for example the exit of the adapter closes its output.
+        adapterProcess = self.adapterProcess
+        match streamType:
+            case StreamType.ADAPTER:
+                return (adapterProcess is None or adapterProcess.outputClosed
+                        or key.fileobj is not adapterProcess.process.stdout)
+            case StreamType.PROCESS:
+                return adapterProcess is None or adapterProcess.pidfd is None or key.fileobj != adapterProcess.pidfd
+            case StreamType.ADAPTER_INPUT:
+                return (adapterProcess is None or adapterProcess.process.stdin.closed
+                        or key.fileobj is not adapterProcess.process.stdin)
+        return False
+
+    def handleEvent(self, streamType: StreamType, key: selectors.SelectorKey, mask: int) -> None:
+        if self._isStale(streamType, key):
+            return
+        match streamType:
+            case StreamType.ADAPTER:
+                self.adapterProcess.readOutput(key.fileobj)
+                if not self.adapterProcess.outputClosed:
+                    # The adapter may have become ready for the first command.
+                    self._dispatchCommand()
+                elif self.adapterProcess.pidfd is None:
+                    self.adapterProcess.reap()
+                    self._onAdapterExit()
+            case StreamType.PROCESS:
+                self.adapterProcess.onExit()
+                self._onAdapterExit()
+            case StreamType.ADAPTER_INPUT:
+                self.adapterProcess.writeInput()
+            case StreamType.CLIENT:
+                client = self.clients.get(key.fileobj)
+                if client and mask & selectors.EVENT_READ:
+                    self._readClient(client)
+                if client and mask & selectors.EVENT_WRITE:
+                    self._flushClient(client)
+            case StreamType.SERVER:
+                self._acceptConnection(key)
+            case StreamType.HEALTH:
+                self._answerHealthCheck()
+
+    def shutdown(self) -> None:
+        try:
+            if self.isRunning:
+                self.adapterProcess.stop()
+                self.adapterProcess.close()
+        finally:
+            pass
+        for client in list(self.clients.values()):
+            self._deregisterClient(client)
+        try:
+            if self.serverSocket:
+                self.serverSocket.shutdown(socket.SHUT_RDWR)
+                self.serverSocket.close()
+        finally:
+            pass
+        if self.unixSocket:
+            self.unixSocket.close()
             try:
-                self.selector.register(self.serverSocket, selectors.EVENT_READ, StreamType.SERVER)
-            except KeyError:
+                os.unlink(self.instance.controlSocket)
+            except OSError:
                 pass
+        if self.healthSocket:
+            self.healthSocket.close()
+
 
-    def runAdapter(self) -> None:
+class JmsAdapterService:
+    # Runs all the instances of the configuration on a single event loop. The
+    # selector data of every registered stream is the manager it belongs to and
+    # the type of the stream.
+    def __init__(self, config: adapterconfig.AdapterConfig, loggers: dict[str, logging.Logger]):
+        self.selector = selectors.DefaultSelector()
+        self.timers = TimerQueue()
+        # The loop is only measured when an instance has the statistics enabled.
+        self.loopStats = LoopStats() if any(instance.stats for instance in config.instances) else None
+        if self.loopStats:
+            self.timers.lag = self.loopStats.lag
+        self.managers = [JmsAdapterManager(instance, loggers[instance.brokerName], self.selector, self.timers,
+                                           self.loopStats)
+                         for instance in config.instances]
+        # Instances with the same metrics address and port share the endpoint.
+        self.exporters: dict[tuple[str, int], MetricsExporter] = {}
+        # Signals write their number to this socket pair, which wakes up the
+        # selector, so they are handled by the event loop like any other event.
+        self.signalReader, self.signalWriter = socket.socketpair()
+        self.signalReader.setblocking(False)
+        self.signalWriter.setblocking(False)
+        self.shuttingDown = False
+
+    def handleEvent(self, streamType: StreamType, key: selectors.SelectorKey, mask: int) -> None:
         try:
-            self._setupServerSocket()
-            self._startAdapter()
-            while self.adapterProcess.isRunning:
-                events = self.selector.select(timeout=None)
+            signals = self.signalReader.recv(64)
+        except BlockingIOError:
+            return
+        for number in signals:
+            if number in (signal.SIGTERM, signal.SIGINT) and not self.shuttingDown:
+                self.shuttingDown = True
+                for manager in self.managers:
+                    manager.logger.info(f"Received {signal.Signals(number).name}: shutting down")
+                    manager.beginShutdown()
+
+    def _exporterFor(self, manager: JmsAdapterManager) -> MetricsExporter | None:
+        instance = manager.instance
+        if not instance.metricsHttpPort:
+            return None
+        address = (instance.metricsHttpAddress, instance.metricsHttpPort)
+        if address not in self.exporters:
+            self.exporters[address] = MetricsExporter(*address, manager.logger)
+            self.exporters[address].start()
+        return self.exporters[address]
+
+    def run(self) -> None:
+        signal.set_wakeup_fd(self.signalWriter.fileno())
+        for number in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(number, lambda number, frame: None)
+        self.selector.register(self.signalReader, selectors.EVENT_READ, (self, StreamType.SIGNAL))
+        try:
+            for manager in self.managers:
+                manager.start(self._exporterFor(manager))
+            loopStats = self.loopStats
+            while any(manager.isActive for manager in self.managers):
+                events = self.selector.select(timeout=self.timers.nextTimeout())
+                if loopStats:
+                    started = time.monotonic()
                 for key, mask in events:
-                    match key.data:
-                        case StreamType.ADAPTER:
-                            self.adapterProcess.readOutput(key.fileobj)
-                            self._sendToClient()
-                        case StreamType.CLIENT:
-                            self._readClient()
-                        case StreamType.SERVER:
-                            self._acceptConnection(key)
-        except KeyboardInterrupt:
-            print()
-            print("KeyboardInterrupt: Terminating")
+                    manager, streamType = key.data
+                    manager.handleEvent(streamType, key, mask)
+                self.timers.runDue()
+                if loopStats:
+                    loopStats.iterations += 1
+                    loopStats.iterationTime.observe((time.monotonic() - started) * 1000)
         finally:
-            try:
-                if self.adapterProcess:
-                    self.adapterProcess.stop()
-            finally:
-                pass
-            try:
-                if self.serverSocket:
-                    self.serverSocket.shutdown(socket.SHUT_RDWR)
-                    self.serverSocket.close()
-            finally:
-                pass
+            for manager in self.managers:
+                manager.shutdown()
+            for exporter in self.exporters.values():
+                exporter.stop()
+            signal.set_wakeup_fd(-1)
+            self.signalReader.close()
+            self.signalWriter.close()
             self.selector.close()
 
 
 def main() -> None:
     config = adapterconfig.AdapterConfig()
-    logger = setupLogger(config)
+    loggers = setupLoggers(config)
     try:
-        jmsAdapterManager = JmsAdapterManager(config, logger)
-        jmsAdapterManager.runAdapter()
+        service = JmsAdapterService(config, loggers)
+        service.run()
     except Exception:
-        logger.error(msg="Unhandled exception", exc_info=True)
+        for logger in loggers.values():
+            logger.error(msg="Unhandled exception", exc_info=True)
         raise
+    finally:
+        for handler in {handler for logger in loggers.values() for handler in logger.handlers}:
+            handler.close()
+    if any(manager.failed for manager in service.managers):
+        # Let the service manager decide whether to start the service again.
+        sys.exit(1)
 
 
-def setupLogger(config: adapterconfig.AdapterConfig) -> logging.Logger:
-
-    logger = logging.Logger(name=config.instance.brokerName, level=logging.INFO)
+def setupLoggers(config: adapterconfig.AdapterConfig) -> dict[str, logging.Logger]:
+    # Every instance logs to its own file. Instances that log to the console
+    # share it, and their lines are prefixed with the broker name when there
+    # is more than one instance.
     formatter = logging.Formatter(fmt='%(asctime)s: %(levelname)s: %(message)s', datefmt='%Y-%m-%dT%H:%M:%S%z')
-    if config.instance.logToFile:
-        pathlib.Path(config.instance.logDirectory).mkdir(parents=True, exist_ok=True)
-        handler = RotatingFileHandler(filename=f"{config.instance.logDirectory}/{config.instance.brokerName}.log",
-                                      maxBytes=1048576, backupCount=3)
-    else:
-        handler = logging.StreamHandler(sys.stdout)
-
-    handler.setLevel(logging.INFO)
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    return logger
+    consoleFormatter = formatter
+    if len(config.instances) > 1:
+        consoleFormatter = logging.Formatter(fmt='%(asctime)s: %(name)s: %(levelname)s: %(message)s',
+                                             datefmt='%Y-%m-%dT%H:%M:%S%z')
+    console: LogWriter = None
+    loggers = {}
+    for instance in config.instances:
+        logger = logging.Logger(name=instance.brokerName, level=logging.INFO)
+        if instance.logToFile:
+            pathlib.Path(instance.logDirectory).mkdir(parents=True, exist_ok=True)
+            handler = LogWriter(fileName=f"{instance.logDirectory}/{instance.brokerName}.log",
+                                maxBytes=instance.logMaxBytes, backupCount=instance.logBackupCount,
+                                compress=instance.logCompress, timed=instance.stats)
+            handler.setFormatter(formatter)
+        else:
+            if console is None:
+                console = LogWriter(stream=sys.stdout, timed=any(
+                    other.stats for other in config.instances if not other.logToFile))
+                console.setFormatter(consoleFormatter)
+            handler = console
+        handler.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        loggers[instance.brokerName] = logger
+    return loggers
 
 
 if __name__ == '__main__':
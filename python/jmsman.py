@@ -15,25 +15,48 @@
 # limitations under the License.
 
 import adapterconfig
+import controlprotocol
 import select
 import socket
 import sys
+import time
+
+# Commands answered by the service itself rather than by the adapter. Their
+# arguments are sent on the same line and their JSON replies are formatted.
+SERVICE_VERBS = ("metrics", "history", "servers", "connections", "properties", "restart", "autoscale", "status",
+                 "stats", "tail", "since", "conn", "conns", "conndiff",
+                 "process")
 
 
 class Connection:
-    def __init__(self, serverPort: int):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    def __init__(self, instance: adapterconfig.AdapterInstance):
         try:
-            self.socket.connect(('localhost', serverPort))
+            self.socket = controlprotocol.connect(instance, None)
             self.socket.setblocking(False)
             self.connected = True
-        except ConnectionRefusedError:
+        except (ConnectionRefusedError, FileNotFoundError):
             self.connected = False
             print()
             print("=" * 27)
             print("The adapter is not running.")
             print("=" * 27)
             print()
+        self.frameReader = controlprotocol.FrameReader()
+        self.binary = False
+
+    def startFramed(self, binary: bool) -> bytes:
+        # Prepares for framed responses and returns the verb that switches the
+        # service to them. The control socket uses the binary framing.
+        self.binary = binary
+        if binary:
+            self.frameReader = controlprotocol.BinaryFrameReader()
+            return controlprotocol.JSON
+        return controlprotocol.FRAMED
+
+    def encodeCommand(self, line: str) -> bytes:
+        if self.binary:
+            return controlprotocol.encodeRequest(line)
+        return line.encode('ascii') + b'\n'
 
     def fileno(self) -> int:
         return self.socket.fileno()
@@ -42,10 +65,10 @@ class Connection:
         try:
             receivedData = False
             while self.connected:
-                message = self.socket.recv(2048)
+                message = self.socket.recv(65536)
                 if message:
                     receivedData = True
-                    print(message.decode('ascii'), end='')
+                    print(message.decode('ascii', errors='replace'), end='')
                     sys.stdout.flush()
                 else:
                     break
@@ -55,8 +78,34 @@ class Connection:
         except BlockingIOError:
             pass
 
+    def readResponse(self, timeout: float | None, onData) -> str | None:
+        # Reads the frames of one response in framed mode, passing the payloads to
+        # onData. Returns the final status, or None on a timeout or disconnect.
+        while self.connected:
+            frame = self.frameReader.nextFrame()
+            if frame is None:
+                readers, _, _ = select.select([self], [], [], timeout)
+                if not readers:
+                    return None
+                try:
+                    message = self.socket.recv(65536)
+                except BlockingIOError:
+                    continue
+                if not message:
+                    self.socket.close()
+                    self.connected = False
+                    return None
+                self.frameReader.feed(message)
+                continue
+            status, payload = frame
+            if payload:
+                onData(payload)
+            if status != controlprotocol.MORE:
+                return status
+        return None
+
     def send(self, message) -> None:
-        self.socket.send(message)
+        self.socket.sendall(message)
 
     def disconnect(self) -> None:
         self.connected = False
@@ -76,13 +125,14 @@ class Input:
 
 
 class JmsAdapterUI:
-    def __init__(self, serverPort: int):
-        self.serverPort = serverPort
+    def __init__(self, instance: adapterconfig.AdapterInstance, responseTimeout: float = 35):
+        self.instance = instance
+        self.responseTimeout = responseTimeout
         self.connection: Connection = None
         self.input: Input = None
 
     def runUI(self) -> None:
-        self.connection = Connection(self.serverPort)
+        self.connection = Connection(self.instance)
         if self.connection.connected:
             self.input = Input()
             self.connection.send(b"s\n")
@@ -91,7 +141,7 @@ class JmsAdapterUI:
                 self.connection.onRead()
                 self.printMenu()
             else:
-                print('Timeout initiating connection. Another connection may be active.')
+                print('Timeout initiating connection. The adapter is not responding.')
                 self.connection.disconnect()
         try:
             while self.connection.connected:
@@ -141,32 +191,140 @@ class JmsAdapterUI:
                         self.connection.send(self.input.buffer.encode('ascii'))
                 self.input.buffer = ''
 
+    def printOutput(self, payload: bytes) -> None:
+        print(payload.decode('ascii', errors='replace'), end='')
+        sys.stdout.flush()
+
+    def printReport(self, payload: bytes) -> None:
+        # Imported here, as the adapter commands do not need it.
+        import json
+        try:
+            report = json.loads(payload)
+        except ValueError:
+            self.printOutput(payload)
+            return
+        for label, value in self.flattenReport(report, ''):
+            print(f"{label:<32}: {value}")
+
+    def flattenReport(self, value, label: str):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                yield from self.flattenReport(item, f"{label}.{key}" if label else key)
+        elif isinstance(value, list) and value and isinstance(value[0], (dict, list)):
+            for index, item in enumerate(value):
+                yield from self.flattenReport(item, f"{label}[{index}]")
+        else:
+            yield label, value
+
+    def runFollow(self) -> None:
+        try:
+            while self.connection.connected:
+                self.connection.readResponse(None, self.printOutput)
+        except KeyboardInterrupt:
+            print()
+
     def runBatch(self, args):
-        self.connection = Connection(self.serverPort)
+        # All commands are sent at once and the service answers each of them with
+        # a framed response, so each response is printed as soon as it is complete.
+        self.connection = Connection(self.instance)
         if self.connection.connected:
+            lowered = [arg.lower() for arg in args]
+            if "follow" in lowered:
+                # Follow ends the commands, optionally with the number of lines to replay.
+                index = lowered.index("follow")
+                follow = args[index:index + 2] if args[index + 1:index + 2] and args[index + 1].isdigit() \
+                    else args[index:index + 1]
+                args = args[:index] + [" ".join(follow)]
+            onData = self.printOutput
+            if lowered[0] in SERVICE_VERBS:
+                args = [" ".join(args)]
+                onData = self.printReport
+            lines = [arg for arg in args if arg.capitalize() not in ("H", "Help")]
+            self.connection.send(self.connection.startFramed(bool(self.instance.controlSocket))
+                                 + b''.join(self.connection.encodeCommand(line) for line in lines))
+            if self.connection.readResponse(self.responseTimeout, self.printOutput) is None:
+                print('Timeout expired reading socket. The adapter is not responding.')
+                args = []
             for arg in args:
                 if arg.capitalize() == "H" or arg.capitalize() == "Help":
                     self.printMenu()
+                elif arg.lower().startswith("follow"):
+                    self.runFollow()
+                else:
+                    status = self.connection.readResponse(self.responseTimeout, onData)
+                    if status is None:
+                        print('Timeout expired reading socket. The adapter is not responding.')
+                        break
+                    if status == controlprotocol.TIMEOUT:
+                        print('The adapter did not complete its response in time.')
+            if self.connection.connected:
+                self.connection.disconnect()
+
+    def runWatch(self, args) -> None:
+        # Repeats S, D or L every interval on one connection. The service answers
+        # from its cache when the data is younger than the interval, so however
+        # many clients watch, the adapter gets at most one command per interval.
+        # Imported here, as the other commands do not need it.
+        import json
+        from watch import WATCH_VERBS, WatchView
+        command = args[0].lower() if args and args[0].lower() in WATCH_VERBS else "s"
+        args = args[1:] if args and args[0].lower() in WATCH_VERBS else args
+        try:
+            interval = max(float(args[0]), 0.5) if args else 2.0
+        except ValueError:
+            print("Usage: watch [s|d|l] [interval in seconds]")
+            return
+        self.connection = Connection(self.instance)
+        if not self.connection.connected:
+            return
+        view = WatchView(command, interval, self.instance.brokerName)
+        self.connection.send(self.connection.startFramed(bool(self.instance.controlSocket)))
+        self.connection.readResponse(self.responseTimeout, lambda payload: None)
+        request = self.connection.encodeCommand(f"{WATCH_VERBS[command]} {interval:g}")
+        nextRefresh = time.monotonic()
+        try:
+            while self.connection.connected:
+                output = bytearray()
+                self.connection.send(request)
+                status = self.connection.readResponse(self.responseTimeout, output.extend)
+                if status is None:
+                    view.showError('Timeout expired reading socket. The adapter is not responding.')
+                    break
+                if status == controlprotocol.OK:
+                    view.show(view.render(json.loads(output)))
                 else:
-                    self.connection.send(arg.encode('ascii') + b'\n')
-                    readers, _, _ = select.select([self.connection], [], [], 3)
-                    if (readers):
-                        self.connection.onRead()
-                    else:
-                        print('Timeout expired reading socket.  Another connection may be active.')
+                    view.showError(output.decode('ascii', errors='replace').strip() or status)
+                # A slow response delays the next refresh rather than causing a burst.
+                nextRefresh = max(nextRefresh + interval, time.monotonic())
+                time.sleep(nextRefresh - time.monotonic())
+        except KeyboardInterrupt:
+            print()
+        if self.connection.connected:
             self.connection.disconnect()
 
 
 def main() -> None:
     config = adapterconfig.AdapterConfig()
+    args = sys.argv[1:]
+    brokerName = None
+    if len(args) >= 2 and args[0] == "-b":
+        # The broker to connect to when the service runs several instances.
+        brokerName = args[1]
+        args = args[2:]
+    try:
+        instance = config.getInstance(brokerName)
+    except KeyError as error:
+        print(error.args[0])
+        sys.exit(1)
     print()
-    print(f"Connecting to broker: {config.instance.brokerName}")
+    print(f"Connecting to broker: {instance.brokerName}")
     print()
-    jmsAdapterUI = JmsAdapterUI(config.instance.controlPort)
-    if len(sys.argv) == 1:
+    jmsAdapterUI = JmsAdapterUI(instance, instance.commandTimeout + 5)
+    if not args:
         jmsAdapterUI.runUI()
+    elif args[0].lower() == "watch":
+        jmsAdapterUI.runWatch(args[1:])
     else:
-        args = sys.argv[1:]
         jmsAdapterUI.runBatch(args)
 
 
@@ -0,0 +1,156 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import TextIO
+
+from servicestats import Histogram
+
+MAX_PENDING = 100000
+MAX_BATCH = 4096
+
+
+class AdapterOutput:
+    # A chunk of adapter output, logged as one record. It is only decoded and
+    # split into lines when it is written, by the thread of the LogWriter.
+    def __init__(self, data: bytes, prefix: str = "OUT: "):
+        self.data = data
+        self.prefix = prefix
+
+    def lines(self) -> list[str]:
+        return [self.prefix + line for line in self.data.decode('ascii', errors='replace').splitlines()]
+
+    def __str__(self) -> str:
+        return "\n".join(self.lines())
+
+
+class LogWriter(logging.Handler):
+    # Queues the records and writes them from a background thread, so logging
+    # never waits for the disk. All records that are queued while the thread is
+    # writing are formatted and written together, with a single flush.
+    def __init__(self, fileName: str = None, maxBytes: int = 0, backupCount: int = 0, compress: bool = False,
+                 stream: TextIO = None, timed: bool = False):
+        super().__init__()
+        self.fileName = fileName
+        self.maxBytes = maxBytes
+        self.backupCount = backupCount
+        self.compress = compress
+        self.stream = stream
+        self.size = 0
+        self.queue = queue.SimpleQueue()
+        self.dropped = 0
+        # The time each batch takes to write, kept when the statistics are enabled.
+        self.writeTime = Histogram() if timed else None
+        if fileName:
+            self._open()
+        self.thread = threading.Thread(target=self._run, name="LogWriter", daemon=True)
+        self.thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.queue.qsize() >= MAX_PENDING:
+            # The disk can not keep up, drop the record instead of growing
+            # without bounds. The number of dropped records is logged later.
+            self.dropped += 1
+            return
+        if record.exc_info:
+            # The traceback has to be rendered before it is passed to the thread.
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        self.queue.put(record)
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.fileName and self.stream:
+            self.stream.close()
+            self.stream = None
+        super().close()
+
+    def _run(self) -> None:
+        while True:
+            records = [self.queue.get()]
+            while len(records) < MAX_BATCH:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = records[-1] is None
+            self._write([record for record in records if record is not None])
+            if stopping:
+                return
+
+    def _write(self, records: list[logging.LogRecord]) -> None:
+        lines = []
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            lines.append(self.format(logging.makeLogRecord({
+                'name': records[0].name if records else '', 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"{dropped} log records were dropped because the log could not be written fast enough"})))
+        for record in records:
+            try:
+                if isinstance(record.msg, AdapterOutput):
+                    output = record.msg
+                    for line in output.lines():
+                        record.msg = line
+                        lines.append(self.format(record))
+                else:
+                    lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        text = "\n".join(lines) + "\n"
+        started = time.perf_counter()
+        try:
+            self.stream.write(text)
+            self.stream.flush()
+            self.size += len(text)
+            if self.fileName and 0 < self.maxBytes <= self.size:
+                self._rotate()
+            if self.writeTime:
+                self.writeTime.observe((time.perf_counter() - started) * 1000)
+        except Exception:
+            if records:
+                self.handleError(records[0])
+
+    def _open(self) -> None:
+        self.stream = open(self.fileName, "a", encoding="utf-8")
+        self.size = self.stream.tell()
+
+    def _backupName(self, index: int) -> str:
+        return f"{self.fileName}.{index}" + (".gz" if self.compress else "")
+
+    def _rotate(self) -> None:
+        self.stream.close()
+        if self.backupCount > 0:
+            for index in range(self.backupCount - 1, 0, -1):
+                if os.path.exists(self._backupName(index)):
+                    os.replace(self._backupName(index), self._backupName(index + 1))
+            if self.compress:
+                with open(self.fileName, "rb") as source, gzip.open(self._backupName(1), "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(self.fileName)
+            else:
+                os.replace(self.fileName, self._backupName(1))
+        else:
+            os.remove(self.fileName)
+        self._open()
@@ -14,21 +14,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
-from os import path
-import platform
+import os
+import sys
 from adapterconfig import AdapterConfig
-from configparser import ConfigParser
+from controlprotocol import ControlSession
+import controlprotocol
 
 
 class Metrics:
-    def __init__(self):
-        pythonDir = path.dirname(path.realpath(__file__))
-        baseDir = path.dirname(pythonDir)
-        config = AdapterConfig()
-        self.hostname = platform.uname().node
-        self.brokerName = config.instance.brokerName
-        self.status = 'Online'
+    # The metrics are read from the snapshot the service keeps of the Summary
+    # of the adapter, see the metricsInterval setting.
+    def __init__(self, brokerName: str = None):
+        instance = AdapterConfig().getInstance(brokerName)
+        self.hostname = os.uname().nodename
+        self.brokerName = instance.brokerName
+        self.status = 'Offline'
+        self.brokerStatus = ''
+        self.timestamp = 0.0
         self.activeServers = 0
         self.busyServers = 0
         self.lockedServers = 0
@@ -42,63 +44,26 @@ class Metrics:
         self.averageRequestWait = 0
         self.maxAdptrThreads = 0
         self.maxClientInstance = 0
+        self.processCpuSeconds = 0.0
+        self.processRssBytes = 0
+        self.processThreads = 0
+        self.processOpenFds = 0
+        self.jvmRssBytes = 0
+        self.heapMaxBytes = 0
+        self.heapPressure = False
 
-        status = subprocess.run([f"{baseDir}/adaptman", "s"], capture_output=True, text=True, check=True)
-        lines = status.stdout.splitlines()
-        for line in lines:
-            try:
-                parts = line.split(':')
-                match parts[0].strip():
-                    case 'The adapter is not running.':
-                        self.status = 'Offline'
-                    case 'Active Servers':
-                        self.activeServers = int(parts[1])
-                    case 'Busy Servers':
-                        self.busyServers = int(parts[1])
-                    case 'Locked Servers':
-                        self.lockedServers = int(parts[1])
-                    case 'Available Servers':
-                        self.availableServers = int(parts[1])
-                    case 'Active Clients (now, peak)':
-                        current, peak = self._valueSplitter(parts[1])
-                        self.currentActiveClients = current
-                        self.maximumActiveClients = peak
-                    case 'Client Queue Depth (cur, max)':
-                        current, peak = self._valueSplitter(parts[1])
-                        self.currentClientQueueDepth = current
-                        self.maximumClientQueueDepth = peak
-                    case 'Total Requests':
-                        self.totalRequests = int(parts[1])
-                    case 'Rq Wait (max, avg)':
-                        mx, av = self._valueSplitter(parts[1])
-                        self.maximumRequestWait = mx
-                        self.averageRequestWait = av
-            except ValueError:
-                pass
-
-        props = ConfigParser(comment_prefixes=('#', '%'))
-        props.read(f"{config.environment['DLC']}/properties/ubroker.properties")
-        if props.has_section(f"Adapter.{self.brokerName}"):
-            self.maxAdptrThreads = props.getint(f"Adapter.{self.brokerName}", "maxAdptrThreads", fallback=0)
-            self.maxClientInstance = props.getint(f"Adapter.{self.brokerName}", "maxClientInstance", fallback=0)
-
-
-    def _valueSplitter(self, value: str):
-        items = value.strip(' ()').split(',')
-        value1 = 0
-        value2 = 0
         try:
-            value1 = int(items[0].strip(' ms'))
-        except ValueError:
-            pass
-        try:
-            if len(items) >= 2:
-                value2 = int(items[1].strip(' ms'))
-        except ValueError:
-            pass
-
-        return value1, value2
-
+            with ControlSession(instance, instance.commandTimeout + 5) as session:
+                status, payload = session.request("metrics")
+        except OSError:
+            return
+        if status == controlprotocol.OK:
+            # Imported here, as an offline service does not need it.
+            import json
+            snapshot = json.loads(payload)
+            for name, value in snapshot.items():
+                if hasattr(self, name):
+                    setattr(self, name, value)
 
     def __str__(self):
         if self.status == 'Online':
@@ -119,14 +84,39 @@ Configuration for broker {self.brokerName} on {self.hostname}:
 Maximum Adapter Threads    : {self.maxAdptrThreads}
 Maximum Clients Instances  : {self.maxClientInstance}
 """
+            if self.processRssBytes:
+                result += f"""
+Processes of broker {self.brokerName} on {self.hostname}:
+CPU Time                   : {self.processCpuSeconds} s
+Resident Memory            : {self.processRssBytes // 1048576} MiB
+Threads                    : {self.processThreads}
+Open Files                 : {self.processOpenFds}
+JVM Resident Memory        : {self.jvmRssBytes // 1048576} MiB
+"""
+            if self.heapMaxBytes:
+                result += f"JVM Maximum Heap           : {self.heapMaxBytes // 1048576} MiB" \
+                          f"{' (close to the limit)' if self.heapPressure else ''}\n"
         else:
             result = f"Broker {self.brokerName} on {self.hostname} is Offline"
         
         return result
 
 
+def history(window: str = "15m", brokerName: str = None) -> dict:
+    # Rates, queue depth trend and request wait percentiles over the window,
+    # derived by the service from its history of snapshots.
+    instance = AdapterConfig().getInstance(brokerName)
+    with ControlSession(instance, instance.commandTimeout + 5) as session:
+        status, payload = session.request(f"history {window}")
+    if status != controlprotocol.OK:
+        raise ValueError(payload.decode('ascii', errors='replace').strip())
+    import json
+    return json.loads(payload)
+
+
 def main() -> None:
-    print(Metrics())
+    # Optionally the name of the broker, when the service runs several instances.
+    print(Metrics(sys.argv[1] if len(sys.argv) > 1 else None))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Samples the resource use of the adapter and its child processes, the JVM
+# among them, from /proc. Linux only; elsewhere the sampler reports nothing.
+
+import os
+import re
+import time
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# Without the children files, /proc is only scanned for new child processes
+# this often; in between, the known processes are read again.
+TREE_RESCAN = 60
+HEAP_OPTION = re.compile(r'^(?:-Xmx|-XX:MaxHeapSize=)(\d+)([kKmMgGtT]?)$')
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4}
+
+
+def parseHeapLimit(jvmArgs: list) -> int | None:
+    # The maximum heap in bytes from -Xmx or -XX:MaxHeapSize, the last one wins
+    # like it does for the JVM.
+    limit = None
+    for arg in jvmArgs:
+        match = HEAP_OPTION.match(arg)
+        if match:
+            limit = int(match.group(1)) * SIZE_UNITS[match.group(2).lower()]
+    return limit
+
+
+def readStat(pid: int) -> dict | None:
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as statFile:
+            data = statFile.read()
+    except OSError:
+        return None
+    # The command name is between parentheses and may contain spaces.
+    nameEnd = data.rindex(b')')
+    fields = data[nameEnd + 2:].split()
+    return {
+        "pid": pid,
+        "name": data[data.index(b'(') + 1:nameEnd].decode('ascii', errors='replace'),
+        "ppid": int(fields[1]),
+        "cpuTicks": int(fields[11]) + int(fields[12]),
+        "threads": int(fields[17]),
+        "startTime": int(fields[19]),
+        "rssBytes": int(fields[21]) * PAGE_SIZE,
+    }
+
+
+def countFds(pid: int) -> int:
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+
+class ProcessSampler:
+    # The tree is found through /proc/<pid>/task/<tid>/children when the kernel
+    # has it, which only reads the files of the tree itself. Without it, every
+    # process in /proc is read to find the children, once every TREE_RESCAN
+    # seconds; the JVM is started with the adapter, so the tree rarely changes.
+    def __init__(self, pid: int, heapLimit: int | None, heapWarningRatio: float):
+        self.pid = pid
+        self.heapLimit = heapLimit
+        self.heapWarningRatio = heapWarningRatio
+        root = readStat(pid)
+        # The start time guards against the PID being reused after the exit.
+        self.startTime = root["startTime"] if root else None
+        self.childrenFiles = os.path.exists(f"/proc/{pid}/task/{pid}/children")
+        self.descendants: list[int] = []
+        self.scanned: float = None
+        self.previousTicks: int = None
+        self.previousTime: float = None
+        self.sample: dict = {}
+        self.processes: list[dict] = []
+
+    def _children(self, pid: int) -> list[int]:
+        children = []
+        try:
+            for tid in os.listdir(f"/proc/{pid}/task"):
+                with open(f"/proc/{pid}/task/{tid}/children", "rb") as childrenFile:
+                    children.extend(int(child) for child in childrenFile.read().split())
+        except OSError:
+            pass
+        return children
+
+    def _tree(self, root: dict, now: float) -> list[dict]:
+        processes = [root]
+        if not self.childrenFiles and self.scanned is not None and now - self.scanned < TREE_RESCAN:
+            # Parents come before their children, and a process only counts
+            # while its parent is still part of the tree.
+            pids = {root["pid"]}
+            for pid in self.descendants:
+                stat = readStat(pid)
+                if stat and stat["ppid"] in pids:
+                    processes.append(stat)
+                    pids.add(pid)
+            return processes
+        if self.childrenFiles:
+            pending = self._children(root["pid"])
+            while pending:
+                stat = readStat(pending.pop())
+                if stat:
+                    processes.append(stat)
+                    pending.extend(self._children(stat["pid"]))
+            return processes
+        byParent: dict[int, list[dict]] = {}
+        for name in os.listdir("/proc"):
+            if name.isdigit():
+                stat = readStat(int(name))
+                if stat:
+                    byParent.setdefault(stat["ppid"], []).append(stat)
+        pending = [root["pid"]]
+        while pending:
+            for stat in byParent.get(pending.pop(), []):
+                processes.append(stat)
+                pending.append(stat["pid"])
+        self.descendants = [process["pid"] for process in processes[1:]]
+        self.scanned = now
+        return processes
+
+    def collect(self) -> dict:
+        # Returns the totals of the tree, as fields for the metrics snapshot, or
+        # an empty dict when the process is gone.
+        root = readStat(self.pid)
+        if root is None or root["startTime"] != self.startTime:
+            self.sample = {}
+            self.processes = []
+            return self.sample
+        now = time.monotonic()
+        processes = self._tree(root, now)
+        for process in processes:
+            process["fds"] = countFds(process["pid"])
+        ticks = sum(process["cpuTicks"] for process in processes)
+        cpuPercent = 0.0
+        if self.previousTime is not None and now > self.previousTime:
+            cpuPercent = round(max(0, ticks - self.previousTicks) / CLOCK_TICKS / (now - self.previousTime) * 100, 1)
+        self.previousTicks = ticks
+        self.previousTime = now
+        # The JVM is the java process of the tree, or the adapter itself when
+        # there is none.
+        jvm = next((process for process in processes if process["name"] == "java"), root)
+        self.processes = processes
+        self.sample = {
+            "processCount": len(processes),
+            "processCpuSeconds": round(ticks / CLOCK_TICKS, 2),
+            "processCpuPercent": cpuPercent,
+            "processRssBytes": sum(process["rssBytes"] for process in processes),
+            "processThreads": sum(process["threads"] for process in processes),
+            "processOpenFds": sum(process["fds"] for process in processes),
+            "jvmPid": jvm["pid"],
+            "jvmRssBytes": jvm["rssBytes"],
+        }
+        if self.heapLimit:
+            # The resident memory includes more than the heap, so this is an
+            # upper bound of the heap use; it flags a heap that is too small.
+            self.sample["heapMaxBytes"] = self.heapLimit
+            self.sample["heapHeadroomBytes"] = self.heapLimit - jvm["rssBytes"]
+            self.sample["heapPressure"] = jvm["rssBytes"] >= self.heapLimit * self.heapWarningRatio
+        return self.sample
+
+    def report(self) -> dict:
+        return {
+            "pid": self.pid,
+            "sample": self.sample,
+            "processes": [{key: process[key] for key in ("pid", "ppid", "name", "threads", "rssBytes", "fds")}
+                          | {"cpuSeconds": round(process["cpuTicks"] / CLOCK_TICKS, 2)}
+                          for process in self.processes],
+        }
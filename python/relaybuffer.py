@@ -0,0 +1,82 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import deque
+import socket
+
+
+class RelayBuffer:
+    # A queue of output chunks waiting to be written to a socket. Chunks are
+    # kept as memoryviews so that partial sends never copy the pending data.
+    # When more than maxBytes is pending, the oldest data is dropped.
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.chunks: deque[memoryview] = deque()
+        self.size = 0
+        self.droppedBytes = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __bool__(self) -> bool:
+        return self.size > 0
+
+    def append(self, data: bytes) -> None:
+        if not data:
+            return
+        chunk = memoryview(data)
+        if len(chunk) > self.maxBytes:
+            self.droppedBytes += len(chunk) - self.maxBytes
+            chunk = chunk[-self.maxBytes:]
+        self.chunks.append(chunk)
+        self.size += len(chunk)
+        while self.size > self.maxBytes:
+            oldest = self.chunks[0]
+            excess = self.size - self.maxBytes
+            if len(oldest) <= excess:
+                self.chunks.popleft()
+                self.size -= len(oldest)
+                self.droppedBytes += len(oldest)
+            else:
+                self.chunks[0] = oldest[excess:]
+                self.size -= excess
+                self.droppedBytes += excess
+
+    def sendTo(self, client: socket.socket) -> int:
+        # Writes as much as the socket accepts without blocking and returns
+        # the number of bytes sent. OSErrors other than EAGAIN are raised.
+        total = 0
+        while self.chunks:
+            chunk = self.chunks[0]
+            try:
+                sent = client.send(chunk)
+            except BlockingIOError:
+                break
+            total += sent
+            self.size -= sent
+            if sent < len(chunk):
+                self.chunks[0] = chunk[sent:]
+                break
+            self.chunks.popleft()
+        return total
+
+    def takeDropped(self) -> int:
+        dropped = self.droppedBytes
+        self.droppedBytes = 0
+        return dropped
+
+    def clear(self) -> None:
+        self.chunks.clear()
+        self.size = 0
@@ -0,0 +1,85 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# The most recent output of the adapter, kept so that clients can replay it
+# without sending commands to the adapter. The output is kept in the chunks
+# in which it was read, each with the time it arrived.
+
+from collections import deque
+from datetime import datetime
+import time
+
+import history
+
+# Accounted per chunk on top of its data, so that many small reads can not
+# grow the memory beyond the limit.
+CHUNK_OVERHEAD = 100
+
+
+class Scrollback:
+    def __init__(self, maxBytes: int, maxLines: int):
+        self.maxBytes = maxBytes
+        self.maxLines = maxLines
+        self.chunks: deque[tuple[float, bytes, int]] = deque()
+        self.size = 0
+        self.lines = 0
+
+    def append(self, data: bytes) -> None:
+        if len(data) + CHUNK_OVERHEAD > self.maxBytes:
+            data = data[-(self.maxBytes - CHUNK_OVERHEAD):]
+        lines = data.count(b'\n')
+        self.chunks.append((time.time(), data, lines))
+        self.size += len(data) + CHUNK_OVERHEAD
+        self.lines += lines
+        while self.size > self.maxBytes or (self.lines > self.maxLines and len(self.chunks) > 1):
+            _, oldest, oldestLines = self.chunks.popleft()
+            self.size -= len(oldest) + CHUNK_OVERHEAD
+            self.lines -= oldestLines
+
+    def tail(self, count: int) -> bytes:
+        # The last count lines, including an incomplete last line.
+        selected = []
+        lines = 0
+        for _, data, chunkLines in reversed(self.chunks):
+            selected.append(data)
+            lines += chunkLines
+            if lines > count:
+                break
+        output = b''.join(reversed(selected))
+        start = len(output) - 1 if output.endswith(b'\n') else len(output)
+        for _ in range(count):
+            start = output.rfind(b'\n', 0, start)
+            if start < 0:
+                return output
+        return output[start + 1:]
+
+    def since(self, timestamp: float) -> bytes:
+        return b''.join(data for arrived, data, _ in self.chunks if arrived >= timestamp)
+
+    def status(self) -> dict:
+        return {"bytes": self.size, "lines": self.lines, "chunks": len(self.chunks),
+                "from": self.chunks[0][0] if self.chunks else None}
+
+
+def parseTime(text: str) -> float:
+    # A duration before now ("90s", "15m", "1h"), a time of today ("09:15") or
+    # an ISO 8601 date and time ("2026-10-17T09:15:00"), as a timestamp.
+    try:
+        return time.time() - history.parseDuration(text)
+    except ValueError:
+        pass
+    if ':' in text and 'T' not in text and '-' not in text:
+        text = f"{datetime.now().date().isoformat()}T{text}"
+    return datetime.fromisoformat(text).timestamp()
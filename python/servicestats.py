@@ -0,0 +1,144 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Counters and latency histograms of the service itself, to tell the time
+# spent in the service apart from the time spent in the adapter. They are
+# only kept for instances with "stats" enabled; otherwise the objects below
+# are never created and the service only tests for None.
+
+import bisect
+import time
+
+# Upper bounds of the histogram buckets in milliseconds. The last bucket
+# holds everything above the highest bound.
+BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+MEGABYTE = 1048576
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, milliseconds: float) -> None:
+        self.counts[bisect.bisect_left(BOUNDS_MS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.maximum:
+            self.maximum = milliseconds
+
+    def percentile(self, fraction: float) -> float:
+        # The upper bound of the bucket that holds the percentile, which is
+        # never reported higher than the largest value observed.
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return round(min(BOUNDS_MS[index], self.maximum) if index < len(BOUNDS_MS) else self.maximum, 3)
+        return round(self.maximum, 3)
+
+    def report(self) -> dict:
+        return {
+            "count": self.count,
+            "meanMs": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50Ms": self.percentile(0.5),
+            "p95Ms": self.percentile(0.95),
+            "p99Ms": self.percentile(0.99),
+            "maxMs": round(self.maximum, 3),
+        }
+
+
+class LoopStats:
+    # The selector loop, which is shared by all instances. The iteration time
+    # is the time spent handling the events and timers of one iteration, the
+    # lag is how late the timers run after their deadline.
+    def __init__(self):
+        self.iterations = 0
+        self.iterationTime = Histogram()
+        self.lag = Histogram()
+
+    def report(self) -> dict:
+        return {"iterations": self.iterations, "iterationTime": self.iterationTime.report(),
+                "lag": self.lag.report()}
+
+
+class InstanceStats:
+    def __init__(self, loop: LoopStats, logWriteTime: Histogram | None):
+        self.started = time.monotonic()
+        self.loop = loop
+        self.logWriteTime = logWriteTime
+        self.adapterBytesRead = 0
+        self.adapterReads = 0
+        self.adapterBytesWritten = 0
+        self.clientBytesSent = 0
+        self.clientBytesDropped = 0
+        self.connects = 0
+        self.disconnects = 0
+        # Command latency from writing the command to the adapter until the end
+        # of its response, by command letter; answers to prompts are "answer".
+        self.commands: dict[str, Histogram] = {}
+        self.timeouts = 0
+        self.errors = 0
+        self.previous: tuple = None
+
+    def commandCompleted(self, name: str, started: float, timedOut: bool, failed: bool) -> None:
+        if timedOut:
+            self.timeouts += 1
+        elif failed:
+            self.errors += 1
+        else:
+            if name not in self.commands:
+                self.commands[name] = Histogram()
+            self.commands[name].observe((time.monotonic() - started) * 1000)
+
+    def report(self) -> dict:
+        return {
+            "uptimeSeconds": round(time.monotonic() - self.started, 3),
+            "loop": self.loop.report(),
+            "adapter": {"bytesRead": self.adapterBytesRead, "reads": self.adapterReads,
+                        "bytesWritten": self.adapterBytesWritten},
+            "clients": {"bytesSent": self.clientBytesSent, "bytesDropped": self.clientBytesDropped,
+                        "connects": self.connects, "disconnects": self.disconnects},
+            "commands": {name: histogram.report() for name, histogram in sorted(self.commands.items())},
+            "commandTimeouts": self.timeouts,
+            "commandErrors": self.errors,
+            "logWriteTime": self.logWriteTime.report() if self.logWriteTime else None,
+        }
+
+    def summaryLine(self) -> str:
+        # One line for the log, with the rates since the previous line.
+        now = time.monotonic()
+        commands = sum(histogram.count for histogram in self.commands.values())
+        current = (now, self.adapterBytesRead, self.clientBytesSent, commands)
+        previous = self.previous or (self.started, 0, 0, 0)
+        self.previous = current
+        elapsed = max(now - previous[0], 0.001)
+        slowest = max(self.commands.items(), key=lambda item: item[1].percentile(0.95), default=None)
+        line = (f"Stats: loop lag p95 {self.loop.lag.percentile(0.95)} ms, "
+                f"iteration p95 {self.loop.iterationTime.percentile(0.95)} ms; "
+                f"adapter {(current[1] - previous[1]) / MEGABYTE / elapsed:.3f} MB/s, "
+                f"clients {(current[2] - previous[2]) / MEGABYTE / elapsed:.3f} MB/s; "
+                f"{current[3] - previous[3]} commands")
+        if slowest:
+            line += f", slowest p95 {slowest[0]!r} {slowest[1].percentile(0.95)} ms"
+        line += f"; {self.timeouts} timeouts; connects {self.connects}, disconnects {self.disconnects}"
+        if self.logWriteTime:
+            line += f"; log write p95 {self.logWriteTime.percentile(0.95)} ms"
+        return line
@@ -0,0 +1,61 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import heapq
+import itertools
+import time
+from typing import Callable
+
+
+class Timer:
+    def __init__(self, deadline: float, callback: Callable[[], None]):
+        self.deadline = deadline
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerQueue:
+    # Timers for the selector loop. The loop uses nextTimeout() as the select
+    # timeout and calls runDue() after handling the events.
+    def __init__(self):
+        self.heap = []
+        self.sequence = itertools.count()
+        # A Histogram of how late the timers run, when the statistics are enabled.
+        self.lag = None
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        timer = Timer(time.monotonic() + delay, callback)
+        heapq.heappush(self.heap, (timer.deadline, next(self.sequence), timer))
+        return timer
+
+    def nextTimeout(self) -> float | None:
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0.0, self.heap[0][0] - time.monotonic())
+
+    def runDue(self) -> None:
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self.heap)
+            if not timer.cancelled:
+                timer.cancelled = True
+                if self.lag is not None:
+                    self.lag.observe((now - timer.deadline) * 1000)
+                timer.callback()
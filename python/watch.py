@@ -0,0 +1,138 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# The screen of "jmsman.py watch": renders the JSON the service returns for
+# the metrics, servers and connections commands, with rates derived from the
+# counters of consecutive replies, and only rewrites the lines that changed.
+
+import sys
+import time
+from typing import TextIO
+
+# The command letter of the adapter and the service verb answering it.
+WATCH_VERBS = {"s": "metrics", "d": "servers", "l": "connections"}
+SUMMARY_FIELDS = (
+    ("brokerStatus", "Broker Status"),
+    ("activeServers", "Active Servers"),
+    ("busyServers", "Busy Servers"),
+    ("lockedServers", "Locked Servers"),
+    ("availableServers", "Available Servers"),
+    ("currentActiveClients", "Active Clients"),
+    ("maximumActiveClients", "Active Clients (peak)"),
+    ("currentClientQueueDepth", "Client Queue Depth"),
+    ("maximumClientQueueDepth", "Client Queue Depth (max)"),
+    ("totalRequests", "Total Requests"),
+    ("averageRequestWait", "Request Wait (avg, ms)"),
+    ("maximumRequestWait", "Request Wait (max, ms)"),
+    ("restarts", "Adapter Restarts"),
+)
+
+
+def rate(current: int, previous: int | None, elapsed: float) -> str:
+    if previous is None or elapsed <= 0 or current < previous:
+        # No earlier value, or the adapter was restarted and reset its counters.
+        return "-"
+    return f"{(current - previous) / elapsed:.2f}"
+
+
+class WatchView:
+    def __init__(self, command: str, interval: float, brokerName: str, stream: TextIO = sys.stdout):
+        self.command = command
+        self.interval = interval
+        self.brokerName = brokerName
+        self.stream = stream
+        self.terminal = stream.isatty()
+        self.screen: list[str] = []
+        # The counters of the previous reply with a different timestamp, by row.
+        self.previous: dict = {}
+        self.previousTimestamp = 0.0
+        self.rates: dict = {}
+
+    def render(self, report: dict) -> list[str]:
+        timestamp = report.get("timestamp", 0.0)
+        if timestamp != self.previousTimestamp:
+            # The service answers from its cache while the data is recent, so
+            # replies can repeat; rates are only updated on new data.
+            elapsed = timestamp - self.previousTimestamp if self.previousTimestamp else 0.0
+            counters = self._counters(report)
+            self.rates = {key: rate(value, self.previous.get(key), elapsed) for key, value in counters.items()}
+            self.previous = counters
+            self.previousTimestamp = timestamp
+        updated = time.strftime('%H:%M:%S', time.localtime(timestamp)) if timestamp else "-"
+        lines = [f"Every {self.interval:g}s: {self.command.upper()} on {self.brokerName}"
+                 f"    data from {updated}    (Ctrl-C to stop)", ""]
+        match self.command:
+            case "s":
+                lines += self._summary(report)
+            case "d":
+                lines += self._servers(report.get("servers", []))
+            case "l":
+                lines += self._connections(report.get("connections", []))
+        return lines
+
+    def _counters(self, report: dict) -> dict:
+        match self.command:
+            case "s":
+                return {"totalRequests": report.get("totalRequests", 0)}
+            case "d":
+                return {server["pid"]: server["requests"] for server in report.get("servers", [])}
+        return {}
+
+    def _summary(self, snapshot: dict) -> list[str]:
+        lines = [f"{label:<28}: {snapshot.get(name, '')}" for name, label in SUMMARY_FIELDS]
+        lines.append(f"{'Requests per second':<28}: {self.rates.get('totalRequests', '-')}")
+        return lines
+
+    def _servers(self, servers: list) -> list[str]:
+        lines = [f"{'PID':>7} {'State':<10} {'Port':>6} {'Requests':>9} {'Rq/s':>8} {'Received':>9} {'Sent':>9}"
+                 f"  Last Change"]
+        for server in servers:
+            lines.append(f"{server['pid']:>7} {server['state']:<10} {server['port']:>6} {server['requests']:>9}"
+                         f" {self.rates.get(server['pid'], '-'):>8} {server['received']:>9} {server['sent']:>9}"
+                         f"  {server['lastChange']}")
+        return lines
+
+    def _connections(self, connections: list) -> list[str]:
+        if not connections:
+            return ["No connections"]
+        labels = list(connections[0]["attributes"])
+        widths = [max([len(label)] + [len(connection["attributes"].get(label, "")) for connection in connections])
+                  for label in labels]
+        lines = ["  ".join(label.ljust(width) for label, width in zip(labels, widths))]
+        for connection in connections:
+            lines.append("  ".join(connection["attributes"].get(label, "").ljust(width)
+                                   for label, width in zip(labels, widths)))
+        return lines
+
+    def show(self, lines: list[str]) -> None:
+        # On a terminal only the lines that changed are rewritten, elsewhere
+        # every refresh is printed in full.
+        if not self.terminal:
+            self.stream.write("\n".join(lines) + "\n\n")
+            self.stream.flush()
+            return
+        output = [] if self.screen else ["\x1b[H\x1b[2J"]
+        for row, line in enumerate(lines):
+            if row >= len(self.screen) or self.screen[row] != line:
+                output.append(f"\x1b[{row + 1};1H{line}\x1b[K")
+        if len(lines) < len(self.screen):
+            output.append(f"\x1b[{len(lines) + 1};1H\x1b[J")
+        output.append(f"\x1b[{len(lines) + 1};1H")
+        self.screen = lines
+        self.stream.write("".join(output))
+        self.stream.flush()
+
+    def showError(self, message: str) -> None:
+        self.show(self.screen[:2] + [message] if self.screen else [message])
@@ -0,0 +1,117 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from os import path
+import random
+import runpy
+
+import pytest
+
+import adapteroutput
+from adapteroutput import (ConnectionRecord, MenuRecord, OutputParser, PropertyRecord, SectionEnd, ServerRecord,
+                           SummaryRecord)
+
+STAND_IN = path.join(path.dirname(path.dirname(path.abspath(__file__))), "benchmarks", "dlc", "bin", "oemessaging")
+
+
+@pytest.fixture
+def transcript(monkeypatch) -> bytes:
+    # The output of the stand-in adapter for S, D, L, C, Y and Z.
+    monkeypatch.setenv("FAKE_PROPERTY_BYTES", "2048")
+    monkeypatch.setenv("FAKE_CONNECTIONS", "3")
+    standIn = runpy.run_path(STAND_IN)
+    adapter = standIn["FakeAdapter"]("test")
+    menu = standIn["MENU"]
+    return (menu + adapter.summary() + menu + adapter.serverDetail() + menu + adapter.connectionSummary() + menu
+            + adapter.connectionDetail() + menu + adapter.properties() + menu
+            + "Enter the property name: name=value\n" + menu).encode('ascii')
+
+
+def parse(chunks) -> list:
+    records = []
+    parser = OutputParser(records.append)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return [(type(record).__name__, record.kind.__name__ if isinstance(record, SectionEnd) else vars(record))
+            for record in records]
+
+
+def split(data: bytes, sizes) -> list[bytes]:
+    chunks = []
+    offset = 0
+    while offset < len(data):
+        size = next(sizes)
+        chunks.append(data[offset:offset + size])
+        offset += size
+    return chunks
+
+
+def test_records(transcript):
+    records = []
+    OutputParser(records.append).feed(transcript)
+    assert sum(isinstance(record, MenuRecord) for record in records) == 7
+    summary = next(record.fields for record in records if isinstance(record, SummaryRecord))
+    assert summary["brokerStatus"] == "ACTIVE"
+    assert summary["activeServers"] == 2
+    assert (summary["maximumRequestWait"], summary["averageRequestWait"]) == (15, 1)
+    servers = [record for record in records if isinstance(record, ServerRecord)]
+    assert [(server.pid, server.state, server.port) for server in servers] == \
+        [(40000, "AVAILABLE", 2002), (40001, "AVAILABLE", 2003)]
+    assert servers[0].started == "Oct 17, 2026 09:12"
+    assert servers[0].lastChange == "Oct 17, 2026 09:15"
+    connections = [record for record in records if isinstance(record, ConnectionRecord)]
+    table = [connection for connection in connections if not connection.detail]
+    blocks = [connection for connection in connections if connection.detail]
+    assert [connection.connectionId for connection in table] == ["conn-000000", "conn-000001", "conn-000002"]
+    assert [connection.clientId for connection in blocks] == ["client-000000", "client-000001", "client-000002"]
+    assert table[2].attributes["Queue"] == "queue.2"
+    assert blocks[1].attributes["Idle Time"] == "1 s"
+    assert [record.kind for record in records if isinstance(record, SectionEnd)] == \
+        [ServerRecord, ConnectionRecord, ConnectionRecord]
+    properties = [(record.name, record.value) for record in records if isinstance(record, PropertyRecord)]
+    assert properties[0] == ("Adapter.test.property000000", "value000000")
+    # The prompt is stripped from the answer that follows it.
+    assert properties[-1] == ("name", "value")
+
+
+@pytest.mark.parametrize("sizes", [[1], [7], [4096], [1, 2, 3, 5, 8, 13, 21, 34, 55, 89]])
+def test_any_split(transcript, sizes):
+    def repeat():
+        while True:
+            yield from sizes
+    assert parse(split(transcript, repeat())) == parse([transcript])
+
+
+def test_random_split(transcript):
+    generator = random.Random(17)
+    sizes = iter(lambda: generator.randint(1, 300), None)
+    assert parse(split(transcript, sizes)) == parse([transcript])
+
+
+def test_long_line_is_dropped():
+    records = []
+    parser = OutputParser(records.append)
+    parser.feed(b'x' * adapteroutput.MAX_LINE)
+    parser.feed(b'x=1')
+    assert not parser.partial
+    parser.feed(b'\nname=value\n')
+    assert [(record.name, record.value) for record in records] == [("name", "value")]
+
+
+def test_prompt():
+    assert adapteroutput.isPrompt(b'Enter the property name: ')
+    assert not adapteroutput.isPrompt(b'Enter the property name: na')
+    assert not adapteroutput.isPrompt(b'Adapter.test.property000012=val')
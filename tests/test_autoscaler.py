@@ -0,0 +1,46 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from autoscaler import Autoscaler
+
+
+def snapshot(total: int, average: int, maximum: int = 200) -> dict:
+    return {"activeServers": 4, "busyServers": 1, "currentClientQueueDepth": 0, "totalRequests": total,
+            "averageRequestWait": average, "maximumRequestWait": maximum}
+
+
+def test_rounding_of_large_totals_is_no_wait():
+    autoscaler = Autoscaler({"downAfter": 100}, 8)
+    assert autoscaler.evaluate(snapshot(1_000_000, 4), 0) == (0, "")
+    assert autoscaler.evaluate(snapshot(1_000_100, 5), 30) == (0, "")
+
+
+def test_request_wait():
+    autoscaler = Autoscaler({"downAfter": 100}, 8)
+    autoscaler.evaluate(snapshot(1000, 4), 0)
+    # 1000 requests that waited 150 ms each.
+    change, reason = autoscaler.evaluate(snapshot(2000, 77), 30)
+    assert change == 1
+    assert "request wait 150 ms" in reason
+
+
+def test_maximum_without_max_adapter_threads():
+    with pytest.raises(ValueError):
+        Autoscaler({}, 0)
+    autoscaler = Autoscaler({"maxServers": 6}, 0)
+    assert autoscaler.maxServers == 6
+    assert Autoscaler({"maxServers": 6}, 4).maxServers == 4
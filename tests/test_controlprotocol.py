@@ -0,0 +1,39 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import json
+
+import pytest
+
+import controlprotocol
+
+
+@pytest.mark.parametrize("command, args", [
+    ("s", None),
+    ("metrics 0.5", None),
+    ('say "hello"', None),
+    ("path c:\\temp", None),
+    ("caf\u00e9", None),
+    ("tab\there", None),
+    ("x", ["1", "2"]),
+])
+def test_encode_request(command, args):
+    frame = controlprotocol.encodeRequest(command, args)
+    reader = controlprotocol.BinaryFrameReader()
+    reader.feed(frame)
+    status, payload = reader.nextFrame()
+    assert status == controlprotocol.REQUEST
+    assert json.loads(payload) == ({"command": command, "args": args} if args else {"command": command})
@@ -0,0 +1,65 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import logging
+import time
+
+from exporter import MetricsExporter
+from fleet import FleetCollector
+
+
+def collect(targets: list[str]) -> dict:
+    collector = FleetCollector(targets, timeout=2)
+    try:
+        return asyncio.run(collector.collect())
+    finally:
+        collector.close()
+
+
+def test_metrics_endpoint():
+    exporter = MetricsExporter("127.0.0.1", 0, logging.getLogger("test"))
+    exporter.start()
+    try:
+        for brokerName in ("orders", "invoices"):
+            exporter.update(brokerName, {"brokerName": brokerName, "status": "Online", "timestamp": time.time(),
+                                         "activeServers": 4, "busyServers": 1, "totalRequests": 10})
+        result = collect([f"http://127.0.0.1:{exporter.server.server_address[1]}"])
+    finally:
+        exporter.stop()
+    assert [broker["brokerName"] for broker in result["brokers"]] == ["orders", "invoices"]
+    assert result["totals"]["online"] == 2
+    assert result["totals"]["activeServers"] == 8
+
+
+def test_invalid_snapshot():
+    async def answer(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.0 200 OK\r\n\r\nnot json")
+        writer.close()
+
+    async def run() -> dict:
+        server = await asyncio.start_server(answer, "127.0.0.1", 0)
+        collector = FleetCollector([f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"], timeout=2)
+        try:
+            return await collector.collect()
+        finally:
+            collector.close()
+            server.close()
+
+    result = asyncio.run(run())
+    assert result["brokers"][0]["status"] == "Error"
+    assert result["totals"]["online"] == 0
@@ -0,0 +1,55 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import time
+
+from history import MetricsHistory, intervalWait
+
+
+def sample(age: float, total: int, average: int, maximum: int = 50) -> dict:
+    return {"timestamp": time.time() - age, "totalRequests": total, "averageRequestWait": average,
+            "maximumRequestWait": maximum}
+
+
+def test_interval_wait():
+    # 100 requests at 4 ms, then 100 at 8 ms: the average goes from 4 to 6.
+    assert intervalWait(4, 100, 6, 200, 50) == 8
+    # A tick of the rounded average of a busy adapter is not a wait.
+    assert intervalWait(4, 1_000_000, 5, 1_000_100, 50) is None
+    assert intervalWait(4, 100, 4, 100, 50) is None
+
+
+def test_summarize_ignores_rounding_of_large_totals():
+    metricsHistory = MetricsHistory(10)
+    metricsHistory.add(sample(20, 1_000_000, 4))
+    metricsHistory.add(sample(10, 1_000_100, 5))
+    summary = metricsHistory.summarize(60)
+    assert summary["requests"] == 100
+    assert summary["requestWaitAverage"] == 5
+    assert summary["requestWaitMax"] == 50
+    assert "requestWaitP99" not in summary
+
+
+def test_summarize_percentiles():
+    metricsHistory = MetricsHistory(10)
+    metricsHistory.add(sample(30, 100, 4))
+    metricsHistory.add(sample(20, 200, 6))
+    metricsHistory.add(sample(10, 1200, 6))
+    summary = metricsHistory.summarize(60)
+    # 100 requests at 8 ms, then 1000 at 6 ms.
+    assert summary["requestWaitP50"] == 6
+    assert summary["requestWaitP90"] == 6
+    assert summary["requestWaitP99"] == 8
@@ -0,0 +1,336 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+from os import path
+import selectors
+import socket
+import stat
+import time
+
+import pytest
+
+import adapterconfig
+import controlprotocol
+from jmsadapter import CommandSource, ControlClient, InternalSource, JmsAdapterManager, ResponseStatus, StreamType
+from timerqueue import TimerQueue
+
+STAND_IN_DLC = path.join(path.dirname(path.dirname(path.abspath(__file__))), "benchmarks", "dlc")
+
+
+class RecordingSource(CommandSource):
+    def __init__(self):
+        super().__init__()
+        self.output = b''
+        self.status: ResponseStatus = None
+        self.statuses: list[ResponseStatus] = []
+
+    def deliver(self, data: bytes) -> None:
+        self.output += data
+
+    def complete(self, status: ResponseStatus) -> None:
+        self.status = status
+        self.statuses.append(status)
+
+    def send(self, manager: JmsAdapterManager, *lines: str) -> None:
+        self.lines.extend(line + '\n' for line in lines)
+        manager._processSource(self)
+
+
+def writeAdapter(dlc, script: str) -> None:
+    adapter = dlc / "bin" / "oemessaging"
+    adapter.parent.mkdir(parents=True)
+    adapter.write_text("#!/bin/sh\n" + script)
+    adapter.chmod(0o755)
+
+
+def isAlive(pid: int) -> bool:
+    # A zombie has exited, it only waits for its parent to reap it.
+    try:
+        with open(f"/proc/{pid}/stat") as statFile:
+            return statFile.read().rpartition(")")[2].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def runUntil(manager: JmsAdapterManager, condition, timeout: float = 10) -> None:
+    # One instance of the event loop of the service.
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        nextTimeout = manager.timers.nextTimeout()
+        for key, mask in manager.selector.select(0.05 if nextTimeout is None else min(0.05, nextTimeout)):
+            owner, streamType = key.data
+            owner.handleEvent(streamType, key, mask)
+        manager.timers.runDue()
+
+
+def makeManager(tmp_path, dlc: str, environment: dict = None, **config) -> JmsAdapterManager:
+    instance = adapterconfig.AdapterInstance(
+        {"brokerName": "test", "controlPort": 0, "logToFile": False, "logDirectory": str(tmp_path),
+         "restartOnFailure": False, **config},
+        {"DLC": dlc, **(environment or {})}, [])
+    return JmsAdapterManager(instance, logging.getLogger("test"), selectors.DefaultSelector(), TimerQueue())
+
+
+def closeManager(manager: JmsAdapterManager) -> None:
+    if manager.adapterProcess and manager.adapterProcess.process.poll() is None:
+        manager.adapterProcess.process.kill()
+        manager.adapterProcess.process.wait()
+    manager.selector.close()
+
+
+def connectClient(manager: JmsAdapterManager, maxOutputBuffer: int = 1048576) -> tuple[ControlClient, socket.socket]:
+    clientSocket, peer = socket.socketpair()
+    client = ControlClient(clientSocket, "test", maxOutputBuffer)
+    manager.clients[clientSocket] = client
+    manager.selector.register(clientSocket, selectors.EVENT_READ, (manager, StreamType.CLIENT))
+    return client, peer
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = makeManager(tmp_path, str(tmp_path / "dlc"))
+    yield manager
+    closeManager(manager)
+
+
+@pytest.fixture
+def standIn(tmp_path):
+    # Starts the stand-in adapter of the benchmarks, with the given environment
+    # and configuration, and waits until it is ready.
+    managers = []
+
+    def start(environment: dict = None, **config) -> JmsAdapterManager:
+        manager = makeManager(tmp_path, STAND_IN_DLC, environment, **config)
+        managers.append(manager)
+        manager._startAdapter()
+        runUntil(manager, lambda: manager.ready)
+        return manager
+
+    yield start
+    for manager in managers:
+        closeManager(manager)
+
+
+def test_exit_and_output_in_one_batch(manager, tmp_path):
+    # A child keeps the output of the adapter open after the adapter exited, so
+    # the exit and the output are reported by the same select().
+    writeAdapter(tmp_path / "dlc", "echo started\nsleep 2 &\nexit 3\n")
+    manager._startAdapter()
+    adapterProcess = manager.adapterProcess
+    if adapterProcess.pidfd is None:
+        pytest.skip("No pidfd on this system")
+    deadline = time.monotonic() + 10
+    events = []
+    while len(events) < 2 and time.monotonic() < deadline:
+        events = manager.selector.select(0.1)
+    assert {key.data[1] for key, _ in events} == {StreamType.ADAPTER, StreamType.PROCESS}
+    # The exit first, as that closes the output.
+    for key, mask in sorted(events, key=lambda event: event[0].data[1] != StreamType.PROCESS):
+        owner, streamType = key.data
+        owner.handleEvent(streamType, key, mask)
+    assert adapterProcess.exitCode == 3
+    assert adapterProcess.process.stdout.closed
+    assert not manager.isRunning
+
+
+def test_restart_while_shutting_down(manager, tmp_path):
+    writeAdapter(tmp_path / "dlc", "exec sleep 10\n")
+    manager._startAdapter()
+    manager.shuttingDown = True
+    source = RecordingSource()
+    manager._verbRestart(source, [])
+    assert source.status == ResponseStatus.ERROR
+    assert not source.busy
+    assert manager.restarts == 0
+    assert manager.onStopped is None
+
+
+def test_history_only_from_the_poll(manager):
+    summary = {"totalRequests": 10, "averageRequestWait": 1, "maximumRequestWait": 2}
+    manager._updateSnapshot(summary)
+    assert manager.history.count == 0
+    manager.historyPending = True
+    manager._updateSnapshot(summary)
+    manager._updateSnapshot(summary)
+    assert manager.history.count == 1
+
+
+def test_offline_after_exit(manager, tmp_path):
+    writeAdapter(tmp_path / "dlc", "exit 1\n")
+    manager.instance.restartOnFailure = True
+    manager.instance.restartDelay = 60
+    manager._startAdapter()
+    manager._updateSnapshot({"brokerStatus": "ACTIVE", "totalRequests": 10})
+    adapterProcess = manager.adapterProcess
+    adapterProcess.process.wait()
+    if adapterProcess.pidfd is None:
+        adapterProcess.reap()
+    else:
+        adapterProcess.onExit()
+    manager._onAdapterExit()
+    assert manager.restartTimer is not None
+    assert manager.snapshot["status"] == "Offline"
+    assert "brokerStatus" not in manager.snapshot
+    # Answered from the offline snapshot rather than after the restart.
+    source = RecordingSource()
+    manager._verbMetrics(source, ["0"])
+    assert source.status == ResponseStatus.OK
+    assert b'"Offline"' in source.output
+    manager.restartTimer.cancel()
+
+
+def test_terminate_signals_the_children(manager, tmp_path):
+    # The JVM is a child of the adapter script.
+    writeAdapter(tmp_path / "dlc", f"sleep 30 &\necho $! > {tmp_path}/child\nwait\n")
+    manager._startAdapter()
+    childFile = tmp_path / "child"
+    deadline = time.monotonic() + 10
+    while not childFile.exists() or not childFile.read_text().strip():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    child = int(childFile.read_text())
+    manager._readyTimedOut()
+    assert manager.adapterProcess.process.wait(10) != 0
+    while isAlive(child):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_control_socket_replaces_only_sockets(manager, tmp_path):
+    path = tmp_path / "control.sock"
+    path.write_text("not a socket")
+    with pytest.raises(OSError):
+        manager._listenUnix(str(path))
+    assert path.read_text() == "not a socket"
+    # A socket left behind by a service that did not stop cleanly.
+    path.unlink()
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    serverSocket = manager._listenUnix(str(path))
+    try:
+        assert stat.S_IMODE(path.stat().st_mode) == 0o660
+    finally:
+        manager.selector.unregister(serverSocket)
+        serverSocket.close()
+
+
+def test_slow_output_is_no_prompt(standIn):
+    # The stand-in writes 64 KiB at a time and then pauses, often mid-line.
+    manager = standIn({"FAKE_OUTPUT_RATE": "100000", "FAKE_PROPERTY_BYTES": "204800"})
+    source = RecordingSource()
+    source.send(manager, "y", "s")
+    runUntil(manager, lambda: len(source.statuses) == 2, 20)
+    assert source.statuses == [ResponseStatus.OK, ResponseStatus.OK]
+    listing, _, summary = source.output.partition(b'::L-ConnSummary')
+    lines = listing.splitlines()[:-1]
+    assert len(lines) > 3000
+    assert all(line.startswith(b'Adapter.test.property') for line in lines)
+    assert b'Active Servers' in summary
+
+
+def test_prompt(standIn):
+    manager = standIn()
+    source = RecordingSource()
+    source.send(manager, "z")
+    runUntil(manager, lambda: source.statuses)
+    assert source.statuses == [ResponseStatus.PROMPT]
+    source.send(manager, "name")
+    runUntil(manager, lambda: len(source.statuses) == 2)
+    assert b'name=value' in source.output
+
+
+def test_prompt_of_a_client_that_disconnects(standIn):
+    manager = standIn()
+    client, peer = connectClient(manager)
+    client.lines.append("z\n")
+    manager._processSource(client)
+    runUntil(manager, lambda: manager.heldBy is client)
+    peer.close()
+    manager._deregisterClient(client)
+    source = RecordingSource()
+    source.send(manager, "s")
+    runUntil(manager, lambda: source.statuses)
+    assert source.statuses == [ResponseStatus.OK]
+    assert b'Active Servers' in source.output
+    assert b'=value' not in source.output
+
+
+def test_prompt_without_answer(standIn):
+    manager = standIn()
+    owner = RecordingSource()
+    owner.send(manager, "z")
+    runUntil(manager, lambda: owner.statuses)
+    manager.holdTimer.cancel()
+    manager._holdExpired()
+    source = RecordingSource()
+    source.send(manager, "s")
+    runUntil(manager, lambda: source.statuses)
+    assert b'Active Servers' in source.output
+
+
+def test_properties_come_from_a_complete_listing(standIn):
+    manager = standIn({"FAKE_PROPERTY_BYTES": "4096"})
+    source = RecordingSource()
+    source.send(manager, "z")
+    runUntil(manager, lambda: source.statuses)
+    source.send(manager, "name")
+    runUntil(manager, lambda: len(source.statuses) == 2)
+    # The single property of the Z does not count as a listing.
+    source.output = b''
+    source.send(manager, "properties Adapter.test")
+    runUntil(manager, lambda: len(source.statuses) == 3)
+    properties = json.loads(source.output)["properties"]
+    assert len(properties) > 50
+    assert "name" not in properties
+    # A listing replaces all properties.
+    manager.properties["stale"] = "value"
+    source.output = b''
+    source.send(manager, "properties 0")
+    runUntil(manager, lambda: len(source.statuses) == 4)
+    assert json.loads(source.output)["properties"].keys() == properties.keys()
+
+
+def test_quiet_output_is_not_followed(standIn):
+    manager = standIn()
+    statuses = []
+    poll = InternalSource(statuses.append)
+    poll.send("s")
+    manager._processSource(poll)
+    source = RecordingSource()
+    source.send(manager, "d")
+    runUntil(manager, lambda: statuses and source.statuses)
+    replay = manager.scrollback.tail(1000)
+    assert b'PID   State' in replay
+    assert b'Active Servers' not in replay
+
+
+def test_framed_client_that_drops_output_is_disconnected(manager):
+    raw, rawPeer = connectClient(manager, 16)
+    framed, framedPeer = connectClient(manager, 16)
+    framed.encodeFrame = controlprotocol.encodeFrame
+    for client in (raw, framed):
+        client.deliver(b'x' * 64)
+        manager._flushClient(client)
+    # The raw output only loses its oldest bytes, a frame cannot lose any.
+    assert not raw.closed
+    assert rawPeer.recv(64) == b'x' * 16
+    assert framed.closed
+    assert framed.socket not in manager.clients
+    rawPeer.close()
+    framedPeer.close()
@@ -0,0 +1,90 @@
+#
+# Copyright 2024 TVH Parts Holding NV, IT department, CoE Progress, Vichtseweg 129, 8790 Waregem, Belgium.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from relaybuffer import RelayBuffer
+
+
+class SlowSocket:
+    # Accepts at most `limit` bytes per send, and nothing once `capacity` is used up.
+    def __init__(self, limit: int, capacity: int):
+        self.limit = limit
+        self.capacity = capacity
+        self.received = b''
+
+    def send(self, data) -> int:
+        if not self.capacity:
+            raise BlockingIOError()
+        sent = min(len(data), self.limit, self.capacity)
+        self.received += bytes(data[:sent])
+        self.capacity -= sent
+        return sent
+
+
+def contents(buffer: RelayBuffer) -> bytes:
+    return b''.join(bytes(chunk) for chunk in buffer.chunks)
+
+
+def test_append_drops_the_oldest_data():
+    buffer = RelayBuffer(10)
+    buffer.append(b'abcd')
+    buffer.append(b'')
+    buffer.append(b'efgh')
+    assert len(buffer) == 8
+    assert buffer.takeDropped() == 0
+    buffer.append(b'ijkl')
+    assert contents(buffer) == b'cdefghijkl'
+    assert len(buffer) == 10
+    assert buffer.takeDropped() == 2
+    buffer.append(b'mnopq')
+    assert contents(buffer) == b'hijklmnopq'
+    assert buffer.takeDropped() == 5
+    assert buffer.takeDropped() == 0
+
+
+def test_append_of_a_chunk_over_the_cap():
+    buffer = RelayBuffer(4)
+    buffer.append(b'ab')
+    buffer.append(b'cdefgh')
+    assert contents(buffer) == b'efgh'
+    assert buffer.takeDropped() == 4
+
+
+def test_short_writes():
+    buffer = RelayBuffer(100)
+    buffer.append(b'abcdef')
+    buffer.append(b'ghij')
+    client = SlowSocket(4, 100)
+    assert buffer.sendTo(client) == 4
+    assert client.received == b'abcd'
+    assert len(buffer) == 6
+    # A short write ends the call, a complete one moves on to the next chunk.
+    assert buffer.sendTo(client) == 6
+    assert client.received == b'abcdefghij'
+    assert not buffer
+
+
+def test_full_socket():
+    buffer = RelayBuffer(100)
+    buffer.append(b'abcdef')
+    buffer.append(b'ghij')
+    client = SlowSocket(100, 7)
+    assert buffer.sendTo(client) == 7
+    assert buffer.sendTo(client) == 0
+    assert contents(buffer) == b'hij'
+    assert len(buffer) == 3
+    client.capacity = 100
+    assert buffer.sendTo(client) == 3
+    assert client.received == b'abcdefghij'